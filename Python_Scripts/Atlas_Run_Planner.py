@@ -0,0 +1,185 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for planning a Deformetrica atlas run before launching it: the control-point grid a kernel width gives over
+# the template, the size of the momenta, the memory of the kPCA Gram matrix and heatmaps, rough runtimes
+# (calibrated from Benchmark_Suite results where available) and worker counts for the parallel stages
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import json
+import time
+import argparse
+import xml.etree.ElementTree as ET
+import numpy as np
+from Batch_Control_Point_Mapping import read_template
+from Deformation_Heatmap_Engine import kernel_block
+from Pipeline_Instrumentation import available_memory_mb
+
+# Deformetrica defaults for a deterministic atlas
+NUMBER_OF_TIME_POINTS = 11
+MAX_ITERATIONS = 100
+# Bytes per value of a momenta text file written by Deformetrica (np.savetxt '%.18e' plus a separator)
+TEXT_BYTES_PER_VALUE = 25
+# Share of the available memory the planner lets parallel workers use
+MEMORY_FRACTION = 0.8
+MB = 1024 ** 2
+
+# Regular grid of control points over the bounding box, as Deformetrica places them: along each axis the points
+# are spacing apart, starting offset = 0.5 * (length - spacing * floor(length / spacing)) from the minimum
+def control_point_grid(bounds_min, bounds_max, spacing):
+    axes = []
+    for low, high in zip(bounds_min, bounds_max):
+        length = high - low
+        offset = 0.5 * (length - spacing * np.floor(length / spacing))
+        axes.append(np.arange(low + offset, high + 1e-10, spacing))
+    grids = np.meshgrid(*axes, indexing='ij')
+    return np.stack([grid.ravel() for grid in grids], axis=1)
+
+# Subjects (and their mesh files) listed in a data_set.xml
+def read_data_set(data_set_xml):
+    root = ET.parse(data_set_xml).getroot()
+    subjects = root.findall('subject')
+    return [subject.get('id') for subject in subjects], [f.text for f in root.iter('filename')]
+
+# Gaussian kernel evaluations (kernel value times a 3-vector) per second on this machine, from a short run
+def kernel_throughput(n_points=2000, n_controlpoints=500, repeats=3):
+    rng = np.random.default_rng(0)
+    points, control_points = rng.random((n_points, 3)), rng.random((n_controlpoints, 3))
+    momenta = rng.random((n_controlpoints, 3))
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        kernel_block(points, control_points, 1.0) @ momenta
+        best = min(best, time.perf_counter() - start)
+    return n_points * n_controlpoints / best
+
+# Power law seconds = a * work^b fitted (in log space) to the benchmark results of one stage; with a single
+# result the time is taken as proportional to the work
+def calibrate(results, stage, work):
+    points = [(work(r), r['min_seconds']) for r in results if r['stage'] == stage and r['min_seconds'] > 0]
+    if not points:
+        return None
+    if len(points) == 1:
+        (w0, s0), = points
+        return lambda w: s0 * w / w0
+    slope, intercept = np.polyfit(np.log([w for w, _ in points]), np.log([s for _, s in points]), 1)
+    return lambda w: float(np.exp(intercept) * w ** slope)
+
+def _kpca_work(n_subjects, n_controlpoints):
+    return n_subjects ** 2 * 3 * n_controlpoints + n_subjects ** 3
+
+# Largest peak memory of one process for a stage in the benchmark results (largest case recorded)
+def stage_peak_mb(results, stage):
+    peaks = [r['peak_rss_mb'] for r in results if r['stage'] == stage]
+    return max(peaks) if peaks else None
+
+def recommend_workers(peak_mb, memory_mb=None, cpu_count=None):
+    cpu_count = cpu_count or os.cpu_count() or 1
+    memory_mb = memory_mb or available_memory_mb()
+    if not peak_mb:
+        return cpu_count
+    return int(max(1, min(cpu_count, MEMORY_FRACTION * memory_mb // peak_mb)))
+
+# Plan a run: control points and sizes from the template, data set and kernel width, runtimes from the benchmark
+# results (a Benchmark_Suite .json, or the latest one in a folder) and worker counts for this machine
+def plan_run(template_vtk, data_set_xml, kernel_width, benchmark=None, number_of_time_points=NUMBER_OF_TIME_POINTS,
+             max_iterations=MAX_ITERATIONS, memory_mb=None, cpu_count=None):
+    template, vertices = read_template(template_vtk)
+    bounds_min, bounds_max = vertices.min(axis=0), vertices.max(axis=0)
+    control_points = control_point_grid(bounds_min, bounds_max, kernel_width)
+    subjects, _ = read_data_set(data_set_xml)
+    n_subjects, n_controlpoints = len(subjects), len(control_points)
+    n_vertices, n_faces = len(vertices), template.GetNumberOfCells()
+    memory_mb = memory_mb or available_memory_mb()
+    cpu_count = cpu_count or os.cpu_count() or 1
+
+    values = n_subjects * n_controlpoints * 3
+    plan = {'template': template_vtk, 'data_set': data_set_xml, 'kernel_width': kernel_width,
+            'bounds': [bounds_min.tolist(), bounds_max.tolist()],
+            'subjects': n_subjects, 'control_points': n_controlpoints,
+            'template_vertices': n_vertices, 'template_faces': n_faces,
+            'momenta_values': values,
+            'momenta_text_mb': values * TEXT_BYTES_PER_VALUE / MB,
+            'momenta_binary_mb': values * 8 / MB,
+            # Gram matrix plus the squared distances it is built from, and the momenta matrix itself
+            'kpca_gram_mb': n_subjects ** 2 * 8 / MB,
+            'kpca_peak_mb': (2 * n_subjects ** 2 + values) * 8 / MB,
+            'heatmap_mb': n_subjects * n_vertices * 4 / MB,
+            'available_memory_mb': memory_mb, 'cpu_count': cpu_count}
+
+    # Deformetrica: every iteration shoots the control points (control point x control point kernels, forward
+    # and backward) and flows the template (control point x vertex kernels) for every subject, over the time steps;
+    # the data attachment compares template and subject faces. A rough count of kernel evaluations.
+    shooting = number_of_time_points * (3 * n_controlpoints ** 2 + 2 * n_controlpoints * n_vertices)
+    kernel_evaluations = max_iterations * n_subjects * (shooting + 3 * n_faces ** 2)
+    throughput = kernel_throughput()
+    plan['deformetrica_kernel_evaluations'] = kernel_evaluations
+    plan['deformetrica_seconds'] = kernel_evaluations / throughput
+    plan['heatmap_seconds'] = n_subjects * n_controlpoints * n_vertices / throughput
+
+    results = []
+    if benchmark is not None:
+        # Benchmark_Suite imports every processing script, so it is only loaded when there are results to read
+        from Benchmark_Suite import load_results, latest_results
+        benchmark = latest_results(benchmark) if os.path.isdir(benchmark) else benchmark
+        results = load_results(benchmark)['results'] if benchmark else []
+        plan['benchmark'] = benchmark
+    parse = calibrate(results, 'parse_momenta', lambda r: r['subjects'] * r['control_points'] * 3)
+    kpca = calibrate(results, 'kpca', lambda r: _kpca_work(r['subjects'], r['control_points']))
+    plan['parse_momenta_seconds'] = parse(values) if parse else None
+    plan['kpca_seconds'] = kpca(_kpca_work(n_subjects, n_controlpoints)) if kpca else None
+
+    # Mesh stages run one mesh per worker; the kPCA permutation tests hold one Gram matrix per worker
+    workers = {stage: recommend_workers(stage_peak_mb(results, stage), memory_mb, cpu_count)
+               for stage in ('centroid', 'ply_to_vtk', 'decimate', 'voxelise')}
+    workers['kpca_sweep'] = recommend_workers(plan['kpca_peak_mb'] + 200, memory_mb, cpu_count)
+    plan['workers'] = workers
+    return plan
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return 'n/a (no benchmark results)'
+    if seconds < 120:
+        return '{:.1f} s'.format(seconds)
+    if seconds < 7200:
+        return '{:.1f} min'.format(seconds / 60)
+    return '{:.1f} h'.format(seconds / 3600)
+
+def print_plan(plan):
+    print(f"Kernel width {plan['kernel_width']}: {plan['control_points']} control points for {plan['subjects']} subjects "
+          f"(template {plan['template_vertices']} vertices)")
+    print(f"  momenta: {plan['momenta_values']} values, {plan['momenta_text_mb']:.1f} MB as text, "
+          f"{plan['momenta_binary_mb']:.1f} MB binary")
+    print(f"  kPCA: Gram matrix {plan['kpca_gram_mb']:.1f} MB, peak about {plan['kpca_peak_mb']:.1f} MB, "
+          f"{_format_seconds(plan['kpca_seconds'])}; parsing the momenta {_format_seconds(plan['parse_momenta_seconds'])}")
+    print(f"  heatmaps: {plan['heatmap_mb']:.1f} MB, about {_format_seconds(plan['heatmap_seconds'])}")
+    print(f"  Deformetrica (very rough, {plan['deformetrica_kernel_evaluations']:.3g} kernel evaluations): "
+          f"about {_format_seconds(plan['deformetrica_seconds'])}")
+    print(f"  workers ({plan['cpu_count']} cores, {plan['available_memory_mb']:.0f} MB available): "
+          + ', '.join(f"{stage} {n}" for stage, n in plan['workers'].items()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Estimate control points, memory and runtime of a Deformetrica atlas run.')
+    parser.add_argument('template', help='initial_template.vtk')
+    parser.add_argument('data_set', help='data_set.xml from Mammal_Dataset_XML_Generation.py')
+    parser.add_argument('kernel_widths', nargs='+', type=float, help='deformation kernel width(s), e.g. 40 20 10')
+    parser.add_argument('--benchmark', default=None, help='Benchmark_Suite results .json, or the folder holding them')
+    parser.add_argument('--time-points', type=int, default=NUMBER_OF_TIME_POINTS)
+    parser.add_argument('--max-iterations', type=int, default=MAX_ITERATIONS)
+    parser.add_argument('--json', default=None, help='also write the plans to this .json file')
+    args = parser.parse_args(argv)
+    plans = [plan_run(args.template, args.data_set, width, args.benchmark, args.time_points, args.max_iterations)
+             for width in args.kernel_widths]
+    for plan in plans:
+        print_plan(plan)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(plans, f, indent=2)
+    return plans
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for mapping control points onto the initial atlas template for every kernel width (headless)
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+from scipy.spatial import cKDTree
+
+CONTROL_POINTS_FILE = "DeterministicAtlas__EstimatedParameters__ControlPoints.txt"
+MAPPED_POINTS_FILE = "mapped_points.txt"
+
+# Load a .vtk mesh and return it together with a zero-copy (n, 3) view of its vertices
+def read_template(vtk_file_path):
+    reader = vtk.vtkPolyDataReader()
+    reader.SetFileName(vtk_file_path)
+    reader.Update()
+    mesh = reader.GetOutput()
+    return mesh, vtk_to_numpy(mesh.GetPoints().GetData())
+
+# Project every control point onto its nearest template vertex with a single KD-tree query
+def map_control_points(mesh_points, control_points):
+    control_points = np.atleast_2d(control_points)
+    _, point_ids = cKDTree(mesh_points).query(control_points[:, :3], workers=-1)
+    return mesh_points[point_ids].astype(np.float64)
+
+# The template is saved in the output folder by Deformetrica, or in the Inputs folder next to it
+def find_template(output_dir):
+    candidates = [os.path.join(output_dir, "initial_template.vtk"),
+                  os.path.join(os.path.dirname(output_dir), "Inputs", "initial_template.vtk")]
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError("No initial_template.vtk found for {}".format(output_dir))
+
+# Find every 'Kernel */output' folder (one per template and kernel width) in a results tree
+def find_output_folders(results_dir):
+    output_dirs = []
+    for root, dirs, files in os.walk(results_dir):
+        if (os.path.basename(root) == "output" and os.path.basename(os.path.dirname(root)).startswith("Kernel ")
+                and CONTROL_POINTS_FILE in files):
+            output_dirs.append(root)
+    return sorted(output_dirs)
+
+# Map the control points of one output folder and save them to mapped_points.txt
+def map_output_folder(output_dir):
+    start = time.perf_counter()
+    _, mesh_points = read_template(find_template(output_dir))
+    control_points = np.loadtxt(os.path.join(output_dir, CONTROL_POINTS_FILE))
+    mapped_points = map_control_points(mesh_points, control_points)
+    np.savetxt(os.path.join(output_dir, MAPPED_POINTS_FILE), mapped_points)
+    return output_dir, len(mapped_points), time.perf_counter() - start
+
+# Map the control points of every output folder in the results tree in parallel
+def batch_map_control_points(results_dir, n_workers=None):
+    output_dirs = find_output_folders(results_dir)
+    if n_workers == 1 or len(output_dirs) < 2:
+        results = [map_output_folder(d) for d in output_dirs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(map_output_folder, output_dirs))
+    for output_dir, n_points, seconds in results:
+        print(f"Mapped {n_points} control points in {output_dir} ({seconds:.2f} s)")
+    return results
+
+if __name__ == '__main__':
+    # Example usage
+    results_directory = "name/of/results/directory"  # e.g. the 'Final Poisson Analysis' folder
+
+    batch_map_control_points(results_directory)
@@ -1,41 +1,67 @@
 import vtk
+from vtk.util.numpy_support import vtk_to_numpy
 import numpy as np
 import os
 import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+from Pipeline_Instrumentation import span, report
 
-def centroid(vtk_points):
-    cp = [0] * 3
-    np_points = vtk_points.GetNumberOfPoints()
-    for i in range(np_points):
-        p = vtk_points.GetPoint(i)
-        cp[0] += p[0]; cp[1] += p[1]; cp[2] += p[2];
-    cp[0] /= np_points; cp[1] /= np_points; cp[2] /= np_points;
-    return cp
-
-def centroid_size(vtk_points):
-    cp = centroid(vtk_points)
-    n = vtk_points.GetNumberOfPoints()
-    S = 0
-    for i in range(n):
-        p = vtk_points.GetPoint(i)
-        S += vtk.vtkMath.Distance2BetweenPoints(p, cp)
-    return np.sqrt(S)
+# View the point buffer of a vtkPoints object as an (n, 3) NumPy array without copying
+def points_to_array(points):
+    if isinstance(points, np.ndarray):
+        return points
+    return vtk_to_numpy(points.GetData())
 
-def get_mesh_files(directory, extension=".vtk"):
-    return [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(extension)]
+def centroid(points):
+    points = points_to_array(points)
+    return points.mean(axis=0, dtype=np.float64)
 
-def batch_process(directory):
-    mesh_files = get_mesh_files(directory)
-    centroid_sizes = []
+def centroid_size(points):
+    points = points_to_array(points)
+    cp = points.mean(axis=0, dtype=np.float64)
+    diff = points - cp
+    return np.sqrt(np.einsum('ij,ij->', diff, diff))
+
+def get_mesh_files(directory, extension=".vtk"):
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(extension))
 
-    for f in mesh_files:
+# Read one mesh and measure it, returning the timings of the read and of the measurement
+def measure_mesh(mesh_file):
+    name = os.path.basename(mesh_file)
+    start = time.perf_counter()
+    with span('centroid.read', name, inputs=[mesh_file]):
         r = vtk.vtkPolyDataReader()
-        r.SetFileName(f)
+        r.SetFileName(mesh_file)
         r.Update()
+    read_time = time.perf_counter() - start
+    start = time.perf_counter()
+    with span('centroid.compute', name):
         centroid_size_value = centroid_size(r.GetOutput().GetPoints())
-        centroid_sizes.append((os.path.basename(f), centroid_size_value))
+    compute_time = time.perf_counter() - start
+    return os.path.basename(mesh_file), centroid_size_value, read_time, compute_time
+
+# Measure every mesh in the directory, spread over n_workers processes (all cores by default).
+# Results keep the sorted file order whatever order the workers finish in.
+def batch_process(directory, n_workers=None, timing_file=None):
+    mesh_files = get_mesh_files(directory)
+    start = time.perf_counter()
 
-    return centroid_sizes
+    if n_workers == 1 or len(mesh_files) < 2:
+        results = [measure_mesh(f) for f in mesh_files]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(measure_mesh, mesh_files))
+
+    for mesh_file, _, read_time, compute_time in results:
+        print(f"{mesh_file}: read {read_time:.3f} s, centroid size {compute_time:.4f} s")
+    print(f"Measured {len(results)} meshes in {time.perf_counter() - start:.2f} s")
+
+    if timing_file is not None:
+        save_timings_to_csv(results, timing_file)
+    report()
+
+    return [(mesh_file, size) for mesh_file, size, _, _ in results]
 
 def save_to_csv(centroid_sizes, output_file):
     with open(output_file, mode='w', newline='') as file:
@@ -44,11 +70,20 @@ def save_to_csv(centroid_sizes, output_file):
         for mesh_file, size in centroid_sizes:
             writer.writerow([mesh_file, size])
 
-# Example usage
-directory = 'E:\James Mulqueeney\Paper 2- Mammal Shape\Final Results and Code\Large Results\Final Poisson Analysis\Arctictis_binturong_atlas\Kernel 20.0'
-output_csv = r'E:\James Mulqueeney\Paper 2- Mammal Shape\Final Results and Code\Deterministic-Atlas-Analysis-main (2)\Deterministic-Atlas-Analysis-main\Data\New Data\Centroid Data\Mesh_centroid_sizes.csv'
+def save_timings_to_csv(results, output_file):
+    with open(output_file, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["Mesh File", "Read Time (s)", "Compute Time (s)"])
+        for mesh_file, _, read_time, compute_time in results:
+            writer.writerow([mesh_file, read_time, compute_time])
+
+if __name__ == '__main__':
+    # Example usage
+    directory = 'E:\James Mulqueeney\Paper 2- Mammal Shape\Final Results and Code\Large Results\Final Poisson Analysis\Arctictis_binturong_atlas\Kernel 20.0'
+    output_csv = r'E:\James Mulqueeney\Paper 2- Mammal Shape\Final Results and Code\Deterministic-Atlas-Analysis-main (2)\Deterministic-Atlas-Analysis-main\Data\New Data\Centroid Data\Mesh_centroid_sizes.csv'
 
-centroid_sizes = batch_process(directory)
-save_to_csv(centroid_sizes, output_csv)
+    # The specimen catalog only re-reads meshes that changed since the last run
+    from Specimen_Catalog import centroid_report
+    centroid_report(directory, output_csv)
 
-print(f"Centroid sizes saved to {output_csv}")
+    print(f"Centroid sizes saved to {output_csv}")
@@ -4,45 +4,134 @@
 
 # Author: James M. Mulqueeney
 
-# Date Last Modified: 13/03/2024
+# Date Last Modified: 18/10/2026
 
 # Load in libraries 
 import os
-from plyfile import PlyData
+import time
+import filecmp
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from plyfile import PlyData, PlyParseError
+from Pipeline_Instrumentation import span, report
+from Stage_Cache import cached_call, summarise_hits, CACHE_BUDGET_MB
+
+# Number of vertices/faces formatted and written per chunk by the streaming converter
+CHUNK_SIZE = 65536
+
+# Write the ASCII header shared by both converters
+def write_ascii_header(f, vertex_count, face_count):
+    f.write("ply\n")
+    f.write("format ascii 1.0\n")
+    f.write("element vertex {}\n".format(vertex_count))
+    f.write("property float x\n")
+    f.write("property float y\n")
+    f.write("property float z\n")
+    f.write("element face {}\n".format(face_count))
+    f.write("property list uchar int vertex_indices\n")
+    f.write("end_header\n")
 
 # Converting ASCII Code 
 def convert_to_ascii(input_file, output_file):
     # Read the non-ASCII PLY file
-    plydata = PlyData.read(input_file)    
+    plydata = PlyData.read(input_file)
     # Write the data in ASCII format
     with open(output_file, 'w') as f:
-        f.write("ply\n")
-        f.write("format ascii 1.0\n")
-        f.write("element vertex {}\n".format(len(plydata.elements[0])))
-        f.write("property float x\n")
-        f.write("property float y\n")
-        f.write("property float z\n")
-        f.write("element face {}\n".format(len(plydata.elements[1])))
-        f.write("property list uchar int vertex_indices\n")
-        f.write("end_header\n")       
+        write_ascii_header(f, len(plydata.elements[0]), len(plydata.elements[1]))
         for vertex in plydata.elements[0]:
-            f.write("{:.6f} {:.6f} {:.6f}\n".format(vertex['x'], vertex['y'], vertex['z']))       
+            f.write("{:.6f} {:.6f} {:.6f}\n".format(vertex['x'], vertex['y'], vertex['z']))
         for face in plydata.elements[1]:
             f.write("{} {} {} {}\n".format(len(face['vertex_indices']), *face['vertex_indices']))
 
-# Use ASCII code to make into a batch process 
-def batch_convert_to_ascii(input_directory, output_directory):
+# Read the PLY file, memory-mapping the binary payload when every face is a triangle
+def read_ply(input_file):
+    try:
+        return PlyData.read(input_file, mmap='r', known_list_len={'face': {'vertex_indices': 3}})
+    except PlyParseError:
+        # Faces of mixed length cannot be memory-mapped
+        return PlyData.read(input_file, mmap=False)
+
+# Format whole chunks of rows with a single % operation instead of one call per line
+def write_vertex_chunks(f, vertices, chunk_size):
+    for start in range(0, len(vertices), chunk_size):
+        chunk = vertices[start:start + chunk_size]
+        values = np.column_stack((chunk['x'], chunk['y'], chunk['z'])).ravel().tolist()
+        f.write(("%.6f %.6f %.6f\n" * len(chunk)) % tuple(values))
+
+def write_face_chunks(f, faces, chunk_size):
+    indices = faces['vertex_indices']
+    for start in range(0, len(faces), chunk_size):
+        chunk = indices[start:start + chunk_size]
+        if chunk.dtype != object:
+            # Fixed-length (memory-mapped) triangles
+            f.write(("3 %d %d %d\n" * len(chunk)) % tuple(chunk.ravel().tolist()))
+        else:
+            f.write("".join("{} {}\n".format(len(face), " ".join(map(str, face))) for face in chunk))
+
+# Streaming converter: same header and field layout as convert_to_ascii, written in bulk chunks
+def stream_convert_to_ascii(input_file, output_file, chunk_size=CHUNK_SIZE):
+    name = os.path.basename(input_file)
+    with span('ascii.read', name, inputs=[input_file]):
+        plydata = read_ply(input_file)
+    vertices = plydata.elements[0].data
+    faces = plydata.elements[1].data
+    with span('ascii.write', name, outputs=[output_file]), open(output_file, 'w') as f:
+        write_ascii_header(f, len(vertices), len(faces))
+        write_vertex_chunks(f, vertices, chunk_size)
+        write_face_chunks(f, faces, chunk_size)
+
+def _convert_pair(paths, converter=stream_convert_to_ascii, cache_dir=None, cache_budget_mb=CACHE_BUDGET_MB):
+    if cache_dir is None:
+        converter(*paths)
+        return os.path.basename(paths[0]), False
+    hit, _ = cached_call(cache_dir, 'ascii', converter, *paths, {}, cache_budget_mb)
+    return os.path.basename(paths[0]), hit
+
+# Use ASCII code to make into a batch process, converting n_workers files at once (all cores by default).
+# With a cache_dir, files converted before (by content) are copied from the cache instead
+def batch_convert_to_ascii(input_directory, output_directory, n_workers=None, cache_dir=None,
+                           cache_budget_mb=CACHE_BUDGET_MB):
     # Ensure the output directory exists
     os.makedirs(output_directory, exist_ok=True)
     # List all .ply files in the input directory and sort them alphabetically
     ply_files = sorted([f for f in os.listdir(input_directory) if f.endswith(".ply")])
-    for filename in ply_files:
-        input_path = os.path.join(input_directory, filename)
-        output_path = os.path.join(output_directory, filename)
-        convert_to_ascii(input_path, output_path)
+    pairs = [(os.path.join(input_directory, filename), os.path.join(output_directory, filename))
+             for filename in ply_files]
+    task = partial(_convert_pair, cache_dir=cache_dir, cache_budget_mb=cache_budget_mb)
+    if n_workers == 1 or len(pairs) < 2:
+        converted = [task(pair) for pair in pairs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            converted = list(executor.map(task, pairs))
+    for filename, hit in converted:
+        print(f"{'Copied cached' if hit else 'Converted'} {filename}")
+    if cache_dir is not None:
+        summarise_hits('ascii', [hit for _, hit in converted])
+    report()
+
+# Time the per-line converter against the streaming converter on one file and check the outputs match
+def benchmark_conversion(input_file, output_directory, repeats=3):
+    os.makedirs(output_directory, exist_ok=True)
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    outputs = {}
+    timings = {}
+    for label, converter in (("per-line", convert_to_ascii), ("streaming", stream_convert_to_ascii)):
+        outputs[label] = os.path.join(output_directory, "{}_{}.ply".format(name, label))
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            converter(input_file, outputs[label])
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best
+    identical = filecmp.cmp(outputs["per-line"], outputs["streaming"], shallow=False)
+    print("per-line: {:.3f} s, streaming: {:.3f} s, speed-up: {:.1f}x, identical output: {}".format(
+        timings["per-line"], timings["streaming"], timings["per-line"] / timings["streaming"], identical))
+    return timings, identical
 
-# Example usage
-input_directory = 'input_directory'  # Replace with the path to your input directory
-output_directory = 'output_directory'  # Replace with the path to your output directory
+if __name__ == '__main__':
+    # Example usage
+    input_directory = 'input_directory'  # Replace with the path to your input directory
+    output_directory = 'output_directory'  # Replace with the path to your output directory
 
-batch_convert_to_ascii(input_directory, output_directory)
+    batch_convert_to_ascii(input_directory, output_directory)
@@ -0,0 +1,262 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for benchmarking the processing scripts on deterministic synthetic meshes and Deformetrica parameter files,
+# recording the wall time and peak memory of every stage to a .json file so runs can be compared over time
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+from multiprocessing import Pool
+import numpy as np
+import trimesh
+from Batch_Mesh_Centroid_Measurement_v1 import measure_mesh
+from Batch_Mesh_to_ASCII import stream_convert_to_ascii
+from New_Folder_Batch_Ply_to_VTK_Convert import convert_ply
+from Mesh_Decimation_Smoothing import process_mesh, FACE_COUNT
+from Pipeline_Instrumentation import peak_memory_mb, available_memory_mb
+from Variable_Batch_Mesh_to_Label_File_Convertor_final import voxelise_mesh_slabs, MEMORY_BUDGET_MB, BUDGET_TOLERANCE
+from Batch_Control_Point_Mapping import read_template, map_control_points
+from Deformetrica_Parameter_Loader import parse_momenta, parse_control_points, MOMENTA_FILE, CONTROL_POINTS_FILE
+from Kernel_PCA_Engine import fit_kpca, rbf_gram, squared_distances, GAMMA
+
+# Nominal face counts of the synthetic meshes
+MESH_SIZES = {'10k': 10000, '100k': 100000, '1M': 1000000}
+# Control point counts of the synthetic Deformetrica runs, and the number of subjects in them
+CONTROL_POINT_COUNTS = (45, 270, 1782)
+N_SUBJECTS = 322
+# Cranium-like ellipsoid semi-axes (mm) and the standard deviation of the radial noise as a fraction of the radius
+ELLIPSOID_AXES = (50.0, 35.0, 30.0)
+NOISE = 0.01
+SEED = 20260101
+# Coarser than the production PITCH_DIVISOR (500) so every case finishes in minutes; the slab mode's memory
+# follows its budget rather than the divisor
+PITCH_DIVISOR = 200.0
+# Memory of a loaded mesh per face (trimesh arrays and caches), used to skip cases that would not fit
+BYTES_PER_FACE = 500
+
+# 'decimate' runs the production smoothing (trimesh), 'decimate_sparse' the sparse-matrix version
+MESH_STAGES = ('centroid', 'ply_to_ascii', 'ply_to_vtk', 'decimate', 'decimate_sparse', 'voxelise',
+               'map_control_points')
+MOMENTA_STAGES = ('parse_momenta', 'kpca')
+RESULTS_PREFIX = 'benchmark_'
+
+# Icosphere with the subdivision level closest to the target face count (20 * 4 ** level faces)
+def synthetic_icosphere(target_faces):
+    level = int(round(np.log(target_faces / 20.0) / np.log(4)))
+    return trimesh.creation.icosphere(subdivisions=max(level, 1), radius=ELLIPSOID_AXES[0])
+
+# UV sphere with about target_faces faces (4 * count ** 2), stretched to the ellipsoid axes with seeded radial noise
+def synthetic_ellipsoid(target_faces, seed=SEED):
+    count = max(4, int(round(np.sqrt(target_faces / 4.0))))
+    mesh = trimesh.creation.uv_sphere(radius=1.0, count=[count, count])
+    rng = np.random.default_rng(seed + target_faces)
+    vertices = mesh.vertices * (1.0 + rng.normal(0.0, NOISE, (len(mesh.vertices), 1)))
+    mesh.vertices = vertices * np.array(ELLIPSOID_AXES)
+    return mesh
+
+# Write a Deformetrica-style parameter folder: control points (one per line) and momenta
+# ('subjects controlpoints dimension' header, then one block of control points per subject)
+def write_synthetic_momenta(folder, n_controlpoints, n_subjects=N_SUBJECTS, seed=SEED):
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed + n_controlpoints)
+    control_points = rng.uniform(-1.0, 1.0, (n_controlpoints, 3)) * np.array(ELLIPSOID_AXES)
+    momenta = rng.normal(0.0, 1.0, (n_subjects, n_controlpoints, 3))
+    np.savetxt(os.path.join(folder, CONTROL_POINTS_FILE), control_points, fmt='%.6f')
+    with open(os.path.join(folder, MOMENTA_FILE), 'w') as f:
+        f.write("{} {} {}\n".format(n_subjects, n_controlpoints, 3))
+        for subject in momenta:
+            f.write("\n")
+            np.savetxt(f, subject, fmt='%.6f')
+
+# Create (once) the .ply and .vtk files of every synthetic mesh and the parameter folders; the files are
+# deterministic, so an existing data folder is reused
+def generate_data(data_dir, mesh_sizes=MESH_SIZES, control_point_counts=CONTROL_POINT_COUNTS, n_subjects=N_SUBJECTS):
+    meshes = {}
+    for label, target in mesh_sizes.items():
+        for shape, make in (('icosphere', synthetic_icosphere), ('ellipsoid', synthetic_ellipsoid)):
+            name = '{}_{}'.format(shape, label)
+            ply_path = os.path.join(data_dir, name + '.ply')
+            vtk_path = os.path.join(data_dir, name + '.vtk')
+            if not os.path.exists(ply_path):
+                os.makedirs(data_dir, exist_ok=True)
+                make(target).export(ply_path)
+            if not os.path.exists(vtk_path):
+                convert_ply(ply_path, vtk_path)
+            meshes[name] = (ply_path, vtk_path)
+    momenta = {}
+    for n_controlpoints in control_point_counts:
+        folder = os.path.join(data_dir, 'momenta_{}_{}'.format(n_controlpoints, n_subjects))
+        if not os.path.exists(os.path.join(folder, MOMENTA_FILE)):
+            write_synthetic_momenta(folder, n_controlpoints, n_subjects)
+        momenta[n_controlpoints] = folder
+    return meshes, momenta
+
+# Inputs a stage needs that are not part of what it measures: the momenta the kPCA is fitted on
+# (their parsing is the 'parse_momenta' stage)
+def _stage_inputs(stage, case):
+    if stage == 'kpca':
+        momenta = parse_momenta(os.path.join(case, MOMENTA_FILE))
+        return momenta.reshape(len(momenta), -1)
+    return None
+
+def _run_stage(stage, case, info, inputs, scratch_dir, options):
+    if stage in MESH_STAGES:
+        name = os.path.splitext(os.path.basename(case[0]))[0]
+    if stage == 'centroid':
+        measure_mesh(case[1])
+    elif stage == 'ply_to_ascii':
+        stream_convert_to_ascii(case[0], os.path.join(scratch_dir, name + '.ply'))
+    elif stage == 'ply_to_vtk':
+        convert_ply(case[0], os.path.join(scratch_dir, name + '.vtk'))
+    elif stage in ('decimate', 'decimate_sparse'):
+        process_mesh(case[0], os.path.join(scratch_dir, name + '_decimated.ply'),
+                     'sparse' if stage == 'decimate_sparse' else 'trimesh',
+                     face_count=min(FACE_COUNT, info['faces'] // 2))
+    elif stage == 'voxelise':
+        voxelise_mesh_slabs(case[0], os.path.join(scratch_dir, name + '.tif'), options['memory_budget_mb'],
+                            options['pitch_divisor'])
+    elif stage == 'map_control_points':
+        # the control points of every synthetic run, mapped onto the mesh
+        _, mesh_points = read_template(case[1])
+        for n_controlpoints, folder in sorted(options['momenta'].items()):
+            map_control_points(mesh_points, parse_control_points(os.path.join(folder, CONTROL_POINTS_FILE)))
+    elif stage == 'parse_momenta':
+        parse_momenta(os.path.join(case, MOMENTA_FILE))
+    elif stage == 'kpca':
+        fit_kpca(rbf_gram(squared_distances(inputs), GAMMA), len(inputs) - 1)
+
+# Memory a case needs beyond the interpreter: the mesh, plus the slab budget for the voxelisation
+def case_memory_mb(stage, info, options):
+    if stage not in MESH_STAGES:
+        return 0.0
+    memory_mb = info['faces'] * BYTES_PER_FACE / 1024 ** 2
+    if stage == 'voxelise':
+        memory_mb += BUDGET_TOLERANCE * options['memory_budget_mb']
+    return memory_mb
+
+# Time one stage on one case in a fresh process, so its peak memory is that of the stage alone; its inputs
+# are prepared before the timer starts
+def _measure(task):
+    stage, case, info, scratch_dir, options = task
+    inputs = _stage_inputs(stage, case)
+    start_rss = peak_memory_mb()
+    start = time.perf_counter()
+    _run_stage(stage, case, info, inputs, scratch_dir, options)
+    return time.perf_counter() - start, start_rss, peak_memory_mb()
+
+def run_benchmarks(data_dir, stages=MESH_STAGES + MOMENTA_STAGES, mesh_sizes=MESH_SIZES,
+                   control_point_counts=CONTROL_POINT_COUNTS, n_subjects=N_SUBJECTS, repeats=3,
+                   pitch_divisor=PITCH_DIVISOR, memory_budget_mb=MEMORY_BUDGET_MB):
+    meshes, momenta = generate_data(data_dir, mesh_sizes, control_point_counts, n_subjects)
+    scratch_dir = os.path.join(data_dir, 'scratch')
+    os.makedirs(scratch_dir, exist_ok=True)
+    options = {'momenta': momenta, 'pitch_divisor': pitch_divisor, 'memory_budget_mb': memory_budget_mb}
+
+    results = []
+    for stage in stages:
+        if stage in MESH_STAGES:
+            cases = [(name, paths, {'faces': len(trimesh.load(paths[0]).faces)}) for name, paths in meshes.items()]
+        else:
+            cases = [('momenta_{}'.format(n), folder, {'control_points': n, 'subjects': n_subjects})
+                     for n, folder in sorted(momenta.items())]
+        for case_name, case, info in cases:
+            needed_mb = case_memory_mb(stage, info, options)
+            if needed_mb > available_memory_mb():
+                print(f"{stage:>20} {case_name:>16}: skipped (needs about {needed_mb:.0f} MB, "
+                      f"{available_memory_mb():.0f} MB available)")
+                continue
+            runs = []
+            for _ in range(repeats):
+                with Pool(1, maxtasksperchild=1) as pool:
+                    runs.append(pool.apply(_measure, ((stage, case, info, scratch_dir, options),)))
+            seconds = [run[0] for run in runs]
+            result = {'stage': stage, 'case': case_name, **info,
+                      'min_seconds': round(min(seconds), 6), 'median_seconds': round(statistics.median(seconds), 6),
+                      'peak_rss_mb': round(max(run[2] for run in runs), 1),
+                      'stage_rss_mb': round(max(run[2] - run[1] for run in runs), 1)}
+            results.append(result)
+            print(f"{stage:>20} {case_name:>16}: {result['min_seconds']:9.3f} s, peak {result['peak_rss_mb']:8.1f} MB "
+                  f"(+{result['stage_rss_mb']:.1f} MB)")
+    return results
+
+def environment():
+    versions = {}
+    for module in ('numpy', 'scipy', 'trimesh', 'vtk', 'sklearn', 'pyvista'):
+        try:
+            versions[module] = __import__(module).__version__
+        except (ImportError, AttributeError):
+            versions[module] = None
+    return {'python': sys.version.split()[0], 'platform': platform.platform(), 'processor': platform.processor(),
+            'cpu_count': os.cpu_count(), 'versions': versions}
+
+def save_results(results, output_dir, parameters):
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    output_file = os.path.join(output_dir, RESULTS_PREFIX + stamp + '.json')
+    suffix = 1
+    while os.path.exists(output_file):
+        suffix += 1
+        output_file = os.path.join(output_dir, '{}{}-{}.json'.format(RESULTS_PREFIX, stamp, suffix))
+    with open(output_file, 'w') as f:
+        json.dump({'timestamp': stamp, 'environment': environment(), 'parameters': parameters,
+                   'results': results}, f, indent=2)
+    print(f"Results saved to {output_file}")
+    return output_file
+
+def load_results(results_file):
+    with open(results_file) as f:
+        return json.load(f)
+
+# Most recent results file in a folder
+def latest_results(output_dir):
+    files = [os.path.join(output_dir, f) for f in os.listdir(output_dir)
+             if f.startswith(RESULTS_PREFIX) and f.endswith('.json')]
+    return max(files, key=os.path.getmtime) if files else None
+
+# Ratio of the new to the old best time for every stage/case in both runs (> 1 is slower)
+def compare_results(old_file, new_file):
+    old = {(r['stage'], r['case']): r for r in load_results(old_file)['results']}
+    ratios = {}
+    for r in load_results(new_file)['results']:
+        previous = old.get((r['stage'], r['case']))
+        if previous is not None and previous['min_seconds'] > 0:
+            ratios[(r['stage'], r['case'])] = r['min_seconds'] / previous['min_seconds']
+            print(f"{r['stage']:>20} {r['case']:>16}: {previous['min_seconds']:9.3f} s -> {r['min_seconds']:9.3f} s "
+                  f"({ratios[(r['stage'], r['case'])]:.2f}x)")
+    return ratios
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the processing scripts on synthetic meshes and momenta.')
+    parser.add_argument('data_dir', help='folder for the synthetic data (reused between runs)')
+    parser.add_argument('--output', default=None, help='folder for the results .json (default: <data_dir>/results)')
+    parser.add_argument('--stages', nargs='+', choices=MESH_STAGES + MOMENTA_STAGES, default=MESH_STAGES + MOMENTA_STAGES)
+    parser.add_argument('--sizes', nargs='+', choices=list(MESH_SIZES), default=list(MESH_SIZES))
+    parser.add_argument('--control-points', nargs='+', type=int, default=list(CONTROL_POINT_COUNTS))
+    parser.add_argument('--subjects', type=int, default=N_SUBJECTS)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--pitch-divisor', type=float, default=PITCH_DIVISOR)
+    parser.add_argument('--memory-budget-mb', type=float, default=MEMORY_BUDGET_MB)
+    parser.add_argument('--compare', action='store_true', help='compare with the previous results file')
+    args = parser.parse_args(argv)
+
+    output_dir = args.output or os.path.join(args.data_dir, 'results')
+    previous = latest_results(output_dir) if os.path.isdir(output_dir) else None
+    results = run_benchmarks(args.data_dir, args.stages, {size: MESH_SIZES[size] for size in args.sizes},
+                             args.control_points, args.subjects, args.repeats, args.pitch_divisor,
+                             args.memory_budget_mb)
+    parameters = {key: value for key, value in vars(args).items() if key not in ('data_dir', 'output', 'compare')}
+    output_file = save_results(results, output_dir, parameters)
+    if args.compare and previous is not None:
+        compare_results(previous, output_file)
+
+if __name__ == '__main__':
+    main()
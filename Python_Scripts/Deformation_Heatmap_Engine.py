@@ -0,0 +1,146 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for per-vertex deformation heatmaps on the atlas template: the Gaussian-kernel velocity field given by the
+# Deformetrica control points and momenta, evaluated at every template vertex for all subjects, in blocks of
+# vertices that fit a memory budget, and saved as VTK point-data arrays.
+# The arrays are the magnitudes of the initial velocity v0(x) = sum_k K(x, c_k) m_k, not displacements: the
+# displacement comes from integrating the flow over time (Shape_Store gives it from the reconstructions)
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import re
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from vtk.util.numpy_support import numpy_to_vtk
+from Pipeline_Instrumentation import span
+from Deformetrica_Parameter_Loader import load_momenta, load_control_points, MOMENTA_FILE, CONTROL_POINTS_FILE
+from Batch_Control_Point_Mapping import read_template, find_template
+from New_Folder_Batch_Ply_to_VTK_Convert import write_polydata
+
+HEATMAP_FILE = 'deformation_heatmaps.vtk'
+MEMORY_BUDGET_MB = 1024
+# With truncation, control points further than TRUNCATION kernel widths from a vertex are skipped
+# (their weight exp(-TRUNCATION^2) is 1.2e-4 at 3 widths)
+TRUNCATION = 3.0
+
+# Kernel width from a 'Kernel <width>' folder of the results tree, e.g. 'Kernel 40.0/output' -> 40.0
+def kernel_width_from_path(path):
+    match = re.search(r'Kernel[ _]([0-9.]+)', os.path.abspath(path))
+    if match is None:
+        raise ValueError("No kernel width in {}; pass it explicitly".format(path))
+    return float(match.group(1).rstrip('.'))
+
+# Vertices per block so the kernel block and the velocities of all subjects stay within the budget
+def block_size(n_controlpoints, n_subjects, memory_budget_mb=MEMORY_BUDGET_MB):
+    bytes_per_vertex = 8 * (2 * n_controlpoints + 3 * n_subjects) + 4 * n_subjects
+    return max(1, int(memory_budget_mb * 1024 ** 2 // bytes_per_vertex))
+
+# Gaussian kernel exp(-|x - c|^2 / width^2) between a block of vertices and the control points (Deformetrica's
+# kernel), dense or, with truncation, as a sparse matrix holding only control points within reach
+def kernel_block(vertices, control_points, kernel_width, truncation=None, control_tree=None):
+    if truncation is None:
+        sq = (np.einsum('ij,ij->i', vertices, vertices)[:, None]
+              + np.einsum('ij,ij->i', control_points, control_points)[None, :] - 2 * (vertices @ control_points.T))
+        np.maximum(sq, 0, out=sq)
+        return np.exp(-sq / kernel_width ** 2)
+    if control_tree is None:
+        control_tree = cKDTree(control_points)
+    near = cKDTree(vertices).sparse_distance_matrix(control_tree, truncation * kernel_width, output_type='coo_matrix')
+    near.data = np.exp(-(near.data / kernel_width) ** 2)
+    return near.tocsr()
+
+# Velocity v(x) = sum_k K(x, c_k) m_k at every vertex for every subject, one block of vertices at a time.
+# momenta is [subjects, controlpoints, 3]; yields (start, stop, velocities [subjects, block, 3])
+def velocity_blocks(vertices, control_points, momenta, kernel_width, truncation=None,
+                    memory_budget_mb=MEMORY_BUDGET_MB):
+    vertices = np.asarray(vertices, dtype=np.float64)
+    control_points = np.asarray(control_points, dtype=np.float64)[:, :3]
+    n_subjects, n_controlpoints, dimension = momenta.shape
+    # [controlpoints, subjects * 3], so each block is a single matrix product for all subjects
+    stacked = np.ascontiguousarray(np.transpose(momenta, (1, 0, 2)).reshape(n_controlpoints, -1), dtype=np.float64)
+    control_tree = cKDTree(control_points) if truncation is not None else None
+    size = block_size(n_controlpoints, n_subjects, memory_budget_mb)
+    for start in range(0, len(vertices), size):
+        stop = min(start + size, len(vertices))
+        with span('heatmap.block'):
+            kernel = kernel_block(vertices[start:stop], control_points, kernel_width, truncation, control_tree)
+            velocities = kernel @ stacked
+        yield start, stop, np.transpose(velocities.reshape(stop - start, n_subjects, dimension), (1, 0, 2))
+
+# Initial velocity magnitudes [subjects, vertices] (float32), and the vectors [subjects, vertices, 3] if asked for
+def deformation_field(vertices, control_points, momenta, kernel_width, truncation=None,
+                      memory_budget_mb=MEMORY_BUDGET_MB, vectors=False):
+    n_subjects = momenta.shape[0]
+    magnitudes = np.empty((n_subjects, len(vertices)), dtype=np.float32)
+    field = np.empty((n_subjects, len(vertices), 3), dtype=np.float32) if vectors else None
+    for start, stop, velocities in velocity_blocks(vertices, control_points, momenta, kernel_width, truncation,
+                                                   memory_budget_mb):
+        magnitudes[:, start:stop] = np.linalg.norm(velocities, axis=2)
+        if vectors:
+            field[:, start:stop] = velocities
+    return magnitudes, field
+
+# Add one point-data array per subject (and the mean over subjects, named mean_name) to the template and write it
+def write_heatmaps(template, magnitudes, names, output_path, field=None, file_format='ascii',
+                   mean_name='mean_initial_velocity'):
+    point_data = template.GetPointData()
+    for array_name, values in [(mean_name, magnitudes.mean(axis=0))] + list(zip(names, magnitudes)):
+        array = numpy_to_vtk(np.ascontiguousarray(values, dtype=np.float32), deep=True)
+        array.SetName(array_name)
+        point_data.AddArray(array)
+    if field is not None:
+        for name, vectors in zip(names, field):
+            array = numpy_to_vtk(np.ascontiguousarray(vectors, dtype=np.float32), deep=True)
+            array.SetName(name + '_vector')
+            point_data.AddArray(array)
+    point_data.SetActiveScalars(mean_name)
+    with span('heatmap.write', outputs=[output_path]):
+        write_polydata(template, output_path, file_format)
+    return output_path
+
+# Subject names in the order of the momenta: the first column of data.csv if it is there
+def subject_names(output_dir, n_subjects):
+    for candidate in (os.path.join(output_dir, 'data.csv'), os.path.join(os.path.dirname(output_dir), 'data.csv')):
+        if os.path.exists(candidate):
+            names = pd.read_csv(candidate).iloc[:, 0].astype(str).tolist()
+            if len(names) == n_subjects:
+                return names
+    return ['subject_{}'.format(idx + 1) for idx in range(n_subjects)]
+
+# Heatmaps for one Deformetrica output folder, written next to its momenta
+def heatmap_output_folder(output_dir, kernel_width=None, truncation=None, memory_budget_mb=MEMORY_BUDGET_MB,
+                          vectors=False, output_path=None):
+    kernel_width = kernel_width or kernel_width_from_path(output_dir)
+    template, vertices = read_template(find_template(output_dir))
+    control_points = load_control_points(os.path.join(output_dir, CONTROL_POINTS_FILE))
+    momenta = load_momenta(os.path.join(output_dir, MOMENTA_FILE), linearise=False)
+    magnitudes, field = deformation_field(vertices, control_points, momenta, kernel_width, truncation,
+                                          memory_budget_mb, vectors)
+    names = subject_names(output_dir, len(momenta))
+    output_path = output_path or os.path.join(output_dir, HEATMAP_FILE)
+    write_heatmaps(template, magnitudes, names, output_path, field)
+    print(f"{len(names)} subjects x {len(vertices)} vertices ({len(control_points)} control points, "
+          f"kernel width {kernel_width}) written to {output_path}")
+    return output_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-vertex deformation heatmaps on the atlas template from the Deformetrica control points and momenta.')
+    parser.add_argument('output_dir', help="Deformetrica output folder (e.g. 'Kernel 40.0/output')")
+    parser.add_argument('--kernel-width', type=float, default=None, help='default: read from the Kernel <width> folder name')
+    parser.add_argument('--truncate', nargs='?', type=float, const=TRUNCATION, default=None,
+                        help='skip control points further than this many kernel widths (default when given: {})'.format(TRUNCATION))
+    parser.add_argument('--memory-budget-mb', type=float, default=MEMORY_BUDGET_MB)
+    parser.add_argument('--vectors', action='store_true', help='also write the velocity vectors')
+    parser.add_argument('--output', default=None, help='.vtk file (default: <output_dir>/' + HEATMAP_FILE + ')')
+    args = parser.parse_args(argv)
+    heatmap_output_folder(args.output_dir, args.kernel_width, args.truncate, args.memory_budget_mb, args.vectors,
+                          args.output)
+
+if __name__ == '__main__':
+    main()
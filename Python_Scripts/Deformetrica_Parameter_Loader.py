@@ -0,0 +1,101 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for loading the momenta and control points estimated by Deformetrica, with a binary (.npy) cache
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import glob
+import numpy as np
+from Pipeline_Instrumentation import span
+
+MOMENTA_FILE = "DeterministicAtlas__EstimatedParameters__Momenta.txt"
+CONTROL_POINTS_FILE = "DeterministicAtlas__EstimatedParameters__ControlPoints.txt"
+
+# Size of the blocks of text parsed at a time
+CHUNK_BYTES = 1 << 24
+
+# Read the 'subjects controlpoints dimension' header line of a momenta file
+def read_momenta_header(momenta_file):
+    with open(momenta_file, 'rb') as f:
+        return tuple(int(value) for value in f.readline().split()[:3])
+
+# Parse whitespace separated numbers from an open file straight into a preallocated flat array,
+# one block at a time so the whole text is never held in memory
+def _parse_into(f, out):
+    filled = 0
+    tail = b''
+    while True:
+        chunk = f.read(CHUNK_BYTES)
+        block = tail + chunk
+        if chunk:
+            # Keep a number cut in half by the end of the block for the next block
+            cut = max(block.rfind(b' '), block.rfind(b'\n')) + 1
+            block, tail = block[:cut], block[cut:]
+        if block.strip():
+            values = np.fromstring(block, sep=' ')
+            if filled + len(values) > len(out):
+                raise ValueError("{} holds more values than expected".format(f.name))
+            out[filled:filled + len(values)] = values
+            filled += len(values)
+        if not chunk:
+            break
+    if filled != len(out):
+        raise ValueError("{} holds {} values, expected {}".format(f.name, filled, len(out)))
+    return out
+
+# Parse a momenta file in one pass: header first, then the body into a [subjects, controlpoints, dimension] array
+def parse_momenta(momenta_file):
+    with open(momenta_file, 'rb') as f:
+        number_of_subjects, number_of_controlpoints, dimension = (int(value) for value in f.readline().split()[:3])
+        momenta = np.empty((number_of_subjects, number_of_controlpoints, dimension))
+        _parse_into(f, momenta.reshape(-1))
+    return momenta
+
+# Parse a control points file (one point per line) into a [controlpoints, dimension] array
+def parse_control_points(control_points_file):
+    with open(control_points_file, 'rb') as f:
+        text = f.read()
+    dimension = len(text.lstrip().split(b'\n', 1)[0].split())
+    return np.fromstring(text, sep=' ').reshape(-1, dimension)
+
+# The sidecar name records the size and modification time of the text file it was made from
+def _sidecar_path(source_file):
+    stat = os.stat(source_file)
+    return "{}.{}-{}.npy".format(source_file, stat.st_size, stat.st_mtime_ns)
+
+# Load the binary sidecar of a text file if it is up to date, otherwise parse the text and write a new sidecar
+def _load_cached(source_file, parse, cache=True, mmap_mode='r'):
+    if not cache:
+        return parse(source_file)
+    sidecar = _sidecar_path(source_file)
+    if os.path.exists(sidecar):
+        return np.load(sidecar, mmap_mode=mmap_mode)
+    array = parse(source_file)
+    # Remove sidecars left over from older versions of the text file
+    for stale in glob.glob(glob.escape(source_file) + ".*-*.npy"):
+        os.remove(stale)
+    try:
+        temporary = sidecar + ".tmp"
+        with open(temporary, 'wb') as f:
+            np.save(f, array)
+        os.replace(temporary, sidecar)
+    except OSError:
+        # A read-only results folder still gets the parsed array, just without a cache
+        return array
+    return np.load(sidecar, mmap_mode=mmap_mode) if mmap_mode else array
+
+# Load momenta as the [subjects, dimension*controlpoints] matrix used for the kPCA
+# (or as [subjects, controlpoints, dimension] with linearise=False)
+def load_momenta(momenta_file, linearise=True, cache=True, mmap_mode='r'):
+    with span('momenta.load', inputs=[momenta_file]):
+        momenta = _load_cached(momenta_file, parse_momenta, cache, mmap_mode)
+    if linearise:
+        return momenta.reshape(momenta.shape[0], -1)
+    return momenta
+
+def load_control_points(control_points_file, cache=True, mmap_mode='r'):
+    return _load_cached(control_points_file, parse_control_points, cache, mmap_mode)
@@ -0,0 +1,220 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for comparing the landmark-free kPCA spaces (Data_A4-A9) with the manual landmarking PCA (Data_A11):
+# Euclidean distance matrices, Mantel and PROTEST permutation tests (as in Mantel_Test.R and Protest_Distance_Measures.R)
+# and the within-order distance correlations of Data_A10 (as in Euclidean_Distance_Measures.R)
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+MANUAL_FILE = 'Data_A11-PCA_Shape_Data_322.csv'
+KPCA_FILES = {'Aligned_Only_40': 'Data_A4-Aligned_Only_k40_kpca.csv',
+              'Aligned_Only_20': 'Data_A5-Aligned_Only_k20_kpca.csv',
+              'Aligned_Only_10': 'Data_A6-Aligned_Only_k10_kpca.csv',
+              'Poisson_40': 'Data_A7-Poisson_k40_kpca.csv',
+              'Poisson_20': 'Data_A8-Poisson_k20_kpca.csv',
+              'Poisson_10': 'Data_A9-Poisson_k10_kpca.csv'}
+N_PERMUTATIONS = 9999
+# Rows of the distance matrix computed at a time, and permutations per task
+BLOCK_ROWS = 1024
+BATCH_SIZE = 100
+# Distances to this specimen are correlated within each order with at least MIN_ORDER_SIZE specimens
+REFERENCE_SPECIMEN = 'Arctictis_binturong'
+MIN_ORDER_SIZE = 10
+
+# Manual (Comp*) and landmark-free (PC*) scores of the specimens in both files, merged on Tip_Label as in the R code
+def read_score_matrices(manual_csv, kpca_csv):
+    manual = pd.read_csv(manual_csv)
+    kpca = pd.read_csv(kpca_csv)
+    manual.columns = manual.columns.str.strip()
+    kpca.columns = kpca.columns.str.strip()
+    comps = [column for column in manual.columns if column.startswith('Comp')]
+    pcs = [column for column in kpca.columns if column.startswith('PC')]
+    merged = pd.merge(manual[['Tip_Label', 'Order'] + comps], kpca[['Tip_Label'] + pcs], on='Tip_Label')
+    merged = merged.sort_values('Tip_Label', kind='stable').reset_index(drop=True)
+    return (merged['Tip_Label'].to_numpy(), merged['Order'].astype(str).str.strip().to_numpy(),
+            merged[comps].to_numpy(dtype=np.float64), merged[pcs].to_numpy(dtype=np.float64))
+
+# Position of the pair (i, j), i < j, in a condensed distance vector of n points (scipy's pdist order)
+def condensed_index(n, i, j):
+    return n * i - i * (i + 1) // 2 + j - i - 1
+
+# Condensed Euclidean distance matrix built a block of rows at a time (each block in float64, stored as dtype),
+# so the full square matrix is never held in memory
+def condensed_distances(X, block_rows=BLOCK_ROWS, dtype=np.float32):
+    X = np.asarray(X, dtype=np.float64)
+    n = len(X)
+    norms = np.einsum('ij,ij->i', X, X)
+    distances = np.empty(n * (n - 1) // 2, dtype=dtype)
+    for start in range(0, n - 1, block_rows):
+        stop = min(start + block_rows, n - 1)
+        block = norms[start:stop, None] + norms[None, :] - 2 * (X[start:stop] @ X.T)
+        np.maximum(block, 0, out=block)
+        np.sqrt(block, out=block)
+        for row in range(start, stop):
+            first = condensed_index(n, row, row + 1)
+            distances[first:first + n - row - 1] = block[row - start, row + 1:]
+    return distances
+
+# Distances from one specimen to every other specimen, read from the condensed vector
+def distance_row(distances, n, i):
+    others = np.delete(np.arange(n), i)
+    lo, hi = np.minimum(others, i), np.maximum(others, i)
+    return others, distances[condensed_index(n, lo, hi)]
+
+# Pearson correlation between the distances of one space and those of the other, for permutations of the
+# specimens of the second space: a permutation p maps pair (i, j) to pair (p[i], p[j])
+def _mantel_batch_statistics(a_centred, b, n, i_index, j_index, permutations, scale):
+    p_i, p_j = permutations[:, i_index], permutations[:, j_index]
+    permuted = b[condensed_index(n, np.minimum(p_i, p_j), np.maximum(p_i, p_j))]
+    # permuting keeps the mean and spread of b, so only the cross product changes
+    return permuted @ a_centred / scale
+
+# Sum of the singular values of X' Y[p] for every permutation p (the PROTEST correlation, with X and Y centred
+# and scaled to unit size)
+def _protest_batch_statistics(X, Y, permutations):
+    cross = np.einsum('ki,pkj->pij', X, Y[permutations])
+    return np.linalg.svd(cross, compute_uv=False).sum(axis=1)
+
+_worker = {}
+
+def _init_worker(state):
+    _worker.update(state)
+
+def _permutation_batch(task):
+    kind, seed, size = task
+    rng = np.random.default_rng(seed)
+    n = _worker['n']
+    permutations = np.array([rng.permutation(n) for _ in range(size)])
+    if kind == 'mantel':
+        return _mantel_batch_statistics(_worker['a_centred'], _worker['b'], n, _worker['i_index'],
+                                        _worker['j_index'], permutations, _worker['scale'])
+    return _protest_batch_statistics(_worker['X'], _worker['Y'], permutations)
+
+# Run the permutations in seeded batches (same results whatever the number of workers) over n_workers processes
+def _permutation_statistics(kind, state, n_permutations, seed, n_workers, batch_size):
+    sizes = [min(batch_size, n_permutations - first) for first in range(0, n_permutations, batch_size)]
+    tasks = [(kind, child, size) for child, size in zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes)]
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers == 1 or len(tasks) < 2:
+        _init_worker(state)
+        batches = [_permutation_batch(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(state,)) as executor:
+            batches = list(executor.map(_permutation_batch, tasks))
+    return np.concatenate(batches) if batches else np.empty(0)
+
+def _result(statistic, permuted, seconds):
+    return {'statistic': float(statistic),
+            'p_value': (np.sum(permuted >= statistic - 1e-12) + 1) / (len(permuted) + 1),
+            'n_permutations': len(permuted),
+            'seconds': seconds,
+            'permutations_per_second': len(permuted) / seconds if seconds > 0 else float('inf')}
+
+# Mantel test (Pearson) between two condensed distance vectors, as vegan::mantel
+def mantel_test(a, b, n_permutations=N_PERMUTATIONS, seed=0, n_workers=None, batch_size=BATCH_SIZE):
+    start = time.perf_counter()
+    a = np.asarray(a, dtype=np.float64)
+    n = int(round((1 + np.sqrt(1 + 8 * len(a))) / 2))
+    a_centred = (a - a.mean()).astype(np.float32)
+    b_centred = (np.asarray(b, dtype=np.float64) - np.mean(b)).astype(np.float32)
+    scale = float(np.linalg.norm(a_centred.astype(np.float64)) * np.linalg.norm(b_centred.astype(np.float64)))
+    statistic = float(a_centred.astype(np.float64) @ b_centred.astype(np.float64)) / scale
+    i_index, j_index = np.triu_indices(n, k=1)
+    state = {'n': n, 'a_centred': a_centred, 'b': b_centred, 'scale': scale,
+             'i_index': i_index.astype(np.int32), 'j_index': j_index.astype(np.int32)}
+    permuted = _permutation_statistics('mantel', state, n_permutations, seed, n_workers, batch_size)
+    return _result(statistic, permuted, time.perf_counter() - start)
+
+# Centre and scale a configuration to unit size, padding with zero columns to the given width
+def _standardise(X, width):
+    X = np.asarray(X, dtype=np.float64)
+    X = X - X.mean(axis=0)
+    X = X / np.sqrt(np.sum(X ** 2))
+    return np.pad(X, ((0, 0), (0, width - X.shape[1])))
+
+# PROTEST (symmetric Procrustes correlation with permutation test), as vegan::protest
+def protest(X, Y, n_permutations=N_PERMUTATIONS, seed=0, n_workers=None, batch_size=BATCH_SIZE):
+    start = time.perf_counter()
+    width = max(X.shape[1], Y.shape[1])
+    X, Y = _standardise(X, width), _standardise(Y, width)
+    statistic = np.linalg.svd(X.T @ Y, compute_uv=False).sum()
+    state = {'n': len(X), 'X': X, 'Y': Y}
+    permuted = _permutation_statistics('protest', state, n_permutations, seed, n_workers, batch_size)
+    result = _result(statistic, permuted, time.perf_counter() - start)
+    result['sum_of_squares'] = 1 - statistic ** 2
+    return result
+
+# R-squared of the distances to the reference specimen in one space against the other, per order
+# (lm(PC_distance ~ Comp_distance) for every order with at least min_order_size specimens, giving Data_A10)
+def within_order_correlations(labels, orders, manual_distances, kpca_distances, reference=REFERENCE_SPECIMEN,
+                              min_order_size=MIN_ORDER_SIZE):
+    n = len(labels)
+    reference_index = int(np.flatnonzero(labels == reference)[0])
+    others, manual_row = distance_row(manual_distances, n, reference_index)
+    _, kpca_row = distance_row(kpca_distances, n, reference_index)
+    table = pd.DataFrame({'Order': orders[others], 'Comp_distance': manual_row.astype(np.float64),
+                          'PC_distance': kpca_row.astype(np.float64)})
+    results = {}
+    for order, group in table.groupby('Order'):
+        if len(group) >= min_order_size:
+            results[order] = np.corrcoef(group['Comp_distance'], group['PC_distance'])[0, 1] ** 2
+    return pd.Series(results, name='r_squared')
+
+# All comparisons of one kPCA space with the manual PCA: the distance matrices are computed once and shared by
+# the Mantel test and the within-order correlations
+def compare_spaces(manual_csv, kpca_csv, n_permutations=N_PERMUTATIONS, seed=0, n_workers=None):
+    labels, orders, manual_scores, kpca_scores = read_score_matrices(manual_csv, kpca_csv)
+    manual_distances = condensed_distances(manual_scores)
+    kpca_distances = condensed_distances(kpca_scores)
+    return {'specimens': len(labels),
+            'mantel': mantel_test(manual_distances, kpca_distances, n_permutations, seed, n_workers),
+            'protest': protest(manual_scores, kpca_scores, n_permutations, seed, n_workers),
+            'order_r_squared': within_order_correlations(labels, orders, manual_distances, kpca_distances)}
+
+# Compare every kPCA dataset of the paper with the manual PCA, returning the test table and the Data_A10 table
+def compare_all(data_dir, n_permutations=N_PERMUTATIONS, seed=0, n_workers=None, output_dir=None):
+    rows = []
+    order_table = {}
+    for name, kpca_file in KPCA_FILES.items():
+        result = compare_spaces(os.path.join(data_dir, MANUAL_FILE), os.path.join(data_dir, kpca_file),
+                                n_permutations, seed, n_workers)
+        mantel, procrustes = result['mantel'], result['protest']
+        rows.append({'Dataset': name, 'Specimens': result['specimens'],
+                     'Mantel r': mantel['statistic'], 'Mantel p': mantel['p_value'],
+                     'PROTEST r': procrustes['statistic'], 'PROTEST p': procrustes['p_value'],
+                     'Procrustes SS': procrustes['sum_of_squares'], 'Permutations': mantel['n_permutations'],
+                     'Mantel permutations/s': round(mantel['permutations_per_second'], 1),
+                     'PROTEST permutations/s': round(procrustes['permutations_per_second'], 1)})
+        order_table[name] = result['order_r_squared']
+        print(f"{name}: Mantel r = {mantel['statistic']:.4f} (p = {mantel['p_value']:.4f}), "
+              f"PROTEST r = {procrustes['statistic']:.4f} (p = {procrustes['p_value']:.4f})")
+    tests = pd.DataFrame(rows)
+    orders = pd.DataFrame(order_table).rename_axis('Order').reset_index()
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        tests.to_csv(os.path.join(output_dir, 'Distance_Matrix_Tests.csv'), index=False)
+        orders.to_csv(os.path.join(output_dir, 'Order_Euclidean_Distance_Correlations.csv'), index=False)
+    return tests, orders
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mantel/PROTEST comparison of the landmark-free kPCA spaces with the manual PCA.')
+    parser.add_argument('data_dir', help='folder with Data_A4-A9 and Data_A11')
+    parser.add_argument('--permutations', type=int, default=N_PERMUTATIONS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--output', default=None, help='folder for the result .csv files')
+    args = parser.parse_args(argv)
+    compare_all(args.data_dir, args.permutations, args.seed, args.workers, args.output)
+
+if __name__ == '__main__':
+    main()
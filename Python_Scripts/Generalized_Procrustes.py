@@ -0,0 +1,121 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for generalized Procrustes alignment of corresponding point sets (mapped control points, landmarks or
+# reconstructions sharing the template topology) for all subjects at once: the rotations of every subject onto
+# the mean shape come from one batched SVD, iterated until the mean shape stops changing
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import csv
+import time
+import argparse
+import numpy as np
+from Pipeline_Instrumentation import span
+from Shape_Store import open_store
+
+TOLERANCE = 1e-10
+MAX_ITERATIONS = 100
+ALIGNED_FILE = 'aligned.npy'
+
+# Centroid sizes of stacked shapes [subjects, points, 3] (the same measure as Batch_Mesh_Centroid_Measurement_v1)
+def centroid_sizes(shapes):
+    centred = shapes - shapes.mean(axis=1, keepdims=True)
+    return np.sqrt(np.einsum('spd,spd->s', centred, centred))
+
+# Centroid sizes from a Batch_Mesh_Centroid_Measurement_v1 .csv, in the order of names (file names with or
+# without their extension)
+def read_centroid_sizes(centroid_csv, names):
+    sizes = {}
+    with open(centroid_csv, newline='') as f:
+        for row in csv.DictReader(f):
+            mesh_file = row['Mesh File'].strip()
+            sizes[mesh_file] = sizes[os.path.splitext(mesh_file)[0]] = float(row['Centroid Size'])
+    missing = [name for name in names if name not in sizes]
+    if missing:
+        raise KeyError("No centroid size in {} for {}".format(centroid_csv, ', '.join(missing[:5])))
+    return np.array([sizes[name] for name in names])
+
+# Rotations [subjects, 3, 3] taking every shape onto the target in the least-squares sense (one batched SVD);
+# without allow_reflection the last singular vector is flipped where the best fit would be a reflection
+def optimal_rotations(shapes, target, allow_reflection=False):
+    covariance = np.swapaxes(shapes, 1, 2) @ target
+    u, _, vt = np.linalg.svd(covariance)
+    if not allow_reflection:
+        flip = np.linalg.det(u @ vt) < 0
+        u[flip, :, -1] *= -1
+    return u @ vt
+
+# Generalized Procrustes alignment of shapes [subjects, points, dimension]: centre, scale to unit centroid size
+# (scale=True, or divide by the given centroid sizes), then rotate all shapes onto their mean until the mean
+# shape changes by less than tolerance. Returns the aligned shapes, mean shape, centroid sizes and rotations.
+def generalized_procrustes(shapes, scale=True, sizes=None, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS,
+                           allow_reflection=False):
+    start = time.perf_counter()
+    with span('gpa'):
+        aligned = np.array(shapes, dtype=np.float64)
+        aligned -= aligned.mean(axis=1, keepdims=True)
+        measured = centroid_sizes(aligned)
+        if sizes is not None:
+            aligned /= np.asarray(sizes, dtype=np.float64)[:, None, None]
+        elif scale:
+            aligned /= measured[:, None, None]
+
+        rotations = np.broadcast_to(np.eye(aligned.shape[2]), (len(aligned),) + (aligned.shape[2],) * 2).copy()
+        mean = aligned[0].copy()
+        converged = False
+        for iteration in range(1, max_iterations + 1):
+            step = optimal_rotations(aligned, mean, allow_reflection)
+            aligned = aligned @ step
+            rotations = rotations @ step
+            new_mean = aligned.mean(axis=0)
+            if scale or sizes is not None:
+                new_mean /= np.sqrt(np.sum(new_mean ** 2))
+            change = np.sqrt(np.sum((new_mean - mean) ** 2))
+            mean = new_mean
+            if change < tolerance:
+                converged = True
+                break
+    return {'aligned': aligned, 'mean': aligned.mean(axis=0), 'centroid_sizes': measured, 'rotations': rotations,
+            'iterations': iteration, 'converged': converged, 'seconds': time.perf_counter() - start}
+
+# Procrustes distance of every aligned shape from the mean shape
+def procrustes_distances(aligned, mean=None):
+    mean = aligned.mean(axis=0) if mean is None else mean
+    return np.sqrt(np.sum((aligned - mean) ** 2, axis=(1, 2)))
+
+# Align the reconstructions of a Shape_Store and save the aligned coordinates (float32) in the store. The centroid
+# .csv is keyed by the original mesh files, so its rows are matched through the data_set.xml filenames of the subjects
+def align_store(store_dir, scale=True, centroid_csv=None, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+    store = open_store(store_dir)
+    sizes = read_centroid_sizes(centroid_csv, store['filenames']) if centroid_csv else None
+    result = generalized_procrustes(store['coordinates'], scale, sizes, tolerance, max_iterations)
+    np.save(os.path.join(store_dir, ALIGNED_FILE), result['aligned'].astype(np.float32))
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generalized Procrustes alignment of corresponding point sets.')
+    parser.add_argument('input', help='Shape_Store folder, or a .npy array [subjects, points, 3]')
+    parser.add_argument('--output', default=None, help='aligned .npy (default: aligned.npy in the store, or <input>_aligned.npy)')
+    parser.add_argument('--no-scaling', action='store_true', help='rotate and translate only')
+    parser.add_argument('--centroid-csv', default=None,
+                        help='for a store, scale by the centroid sizes of the original meshes '
+                             '(Mesh_centroid_sizes.csv of Batch_Mesh_Centroid_Measurement_v1 or Pipeline_CLI.py centroid)')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--max-iterations', type=int, default=MAX_ITERATIONS)
+    args = parser.parse_args(argv)
+    if os.path.isdir(args.input):
+        result = align_store(args.input, not args.no_scaling, args.centroid_csv, args.tolerance, args.max_iterations)
+    else:
+        result = generalized_procrustes(np.load(args.input, mmap_mode='r'), not args.no_scaling,
+                                        tolerance=args.tolerance, max_iterations=args.max_iterations)
+    if args.output or not os.path.isdir(args.input):
+        np.save(args.output or os.path.splitext(args.input)[0] + '_aligned.npy', result['aligned'])
+    print(f"Aligned {len(result['aligned'])} shapes in {result['iterations']} iterations "
+          f"({'converged' if result['converged'] else 'not converged'}, {result['seconds']:.3f} s)")
+
+if __name__ == '__main__':
+    main()
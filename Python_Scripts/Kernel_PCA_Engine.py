@@ -0,0 +1,93 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for the kernel PCA of the momenta, with a precomputed Gram matrix shared across gamma values
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import KernelPCA
+from Pipeline_Instrumentation import span
+
+# Settings used in the paper
+GAMMA = .0000025
+N_COMPONENTS = 321
+# The exact eigendecomposition is used unless another solver is asked for: the Gram matrices here are only
+# n_subjects x n_subjects (322), and the randomized solver's scores drift from the exact ones when the spectrum is flat
+EIGEN_SOLVER = "dense"
+
+# Pairwise squared Euclidean distances between the rows of X, computed once and reused for every gamma
+def squared_distances(X):
+    X = np.asarray(X, dtype=np.float64)
+    norms = np.einsum('ij,ij->i', X, X)
+    distances = norms[:, None] + norms[None, :] - 2 * (X @ X.T)
+    np.maximum(distances, 0, out=distances)
+    np.fill_diagonal(distances, 0)
+    return distances
+
+# RBF Gram matrix exp(-gamma * ||x - y||^2) from the squared distances
+def rbf_gram(sq_distances, gamma):
+    return np.exp(-gamma * sq_distances)
+
+# Fit the kPCA from a precomputed Gram matrix. The inverse transform cannot be fitted from a
+# precomputed kernel, so fit_inverse_transform=True refits from the momenta themselves. eigen_solver 'randomized'
+# (or 'arpack') is opt-in for much larger Gram matrices where only the leading components are needed.
+def fit_kpca(gram=None, n_components=N_COMPONENTS, eigen_solver=None, fit_inverse_transform=False,
+             momenta=None, gamma=GAMMA, random_state=0):
+    if fit_inverse_transform:
+        kpca = KernelPCA(kernel="rbf", n_components=n_components, gamma=gamma, fit_inverse_transform=True)
+        return kpca, kpca.fit_transform(momenta)
+    if gram is None:
+        with span('kpca.gram'):
+            gram = rbf_gram(squared_distances(momenta), gamma)
+    if eigen_solver is None:
+        eigen_solver = EIGEN_SOLVER
+    kpca = KernelPCA(kernel="precomputed", n_components=n_components, eigen_solver=eigen_solver,
+                     random_state=random_state)
+    with span('kpca.fit'):
+        return kpca, kpca.fit_transform(gram)
+
+# Fit one kPCA per gamma, building each Gram matrix from the same squared distances
+def kpca_gamma_sweep(momenta, gammas, n_components=N_COMPONENTS, eigen_solver=None):
+    sq_distances = squared_distances(momenta)
+    results = {}
+    for gamma in gammas:
+        results[gamma] = fit_kpca(rbf_gram(sq_distances, gamma), n_components, eigen_solver)
+    return results
+
+# Eigenvalues and normalised eigenvectors (named lambdas_/alphas_ in older scikit-learn)
+def kpca_eigen(kpca):
+    eigenvalues = getattr(kpca, "eigenvalues_", None)
+    if eigenvalues is None:
+        eigenvalues = kpca.lambdas_
+    eigenvectors = getattr(kpca, "eigenvectors_", None)
+    if eigenvectors is None:
+        eigenvectors = kpca.alphas_
+    return eigenvalues, eigenvectors / np.linalg.norm(eigenvectors, axis=0)
+
+# Eigenvalue table in the eigenvalues.csv layout
+def eigenvalue_table(kpca):
+    eigenvalues, eigenvectors = kpca_eigen(kpca)
+    eig = pd.DataFrame()
+    eig['PCA dimension'] = ['PC{}'.format(idx+1) for idx in range(len(eigenvalues))]
+    eig['cum. variability (in %)'] = 100 * np.cumsum(eigenvalues) / np.sum(eigenvalues)
+    eig['lambda'] = eigenvalues
+    eig['alpha'] = list(np.transpose(eigenvectors))
+    return eig
+
+# Add the kPCA scores to the population table in the kpca.csv layout
+def kpca_table(df, X_kpca):
+    scores = pd.DataFrame(X_kpca, index=df.index, columns=['PC{}'.format(idx+1) for idx in range(X_kpca.shape[1])])
+    return pd.concat([df.drop(columns=scores.columns, errors='ignore'), scores], axis=1)
+
+# Write kpca.csv and eigenvalues.csv to the working directory
+def export_results(working_directory, df, kpca, X_kpca):
+    eig = eigenvalue_table(kpca)
+    eig.to_csv(os.path.join(working_directory, 'eigenvalues.csv'))
+    df = kpca_table(df, X_kpca)
+    df.to_csv(os.path.join(working_directory, 'kpca.csv'))
+    return df, eig
@@ -0,0 +1,184 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for saving a fitted kPCA and projecting new specimens' momenta into the same space without refitting,
+# refitting (with components matched to the old space) only when the new specimens drift too far from it
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from Pipeline_Instrumentation import span
+from Deformetrica_Parameter_Loader import load_momenta
+from Kernel_PCA_Engine import fit_kpca, kpca_eigen, rbf_gram, squared_distances, GAMMA, N_COMPONENTS
+
+MODEL_FILE = 'kpca_model.npz'
+# Rows of new momenta projected at a time
+BATCH_SIZE = 256
+# Refit when the new specimens leave more than this fraction of their (centred) feature-space variance
+# outside the fitted components, on average
+DRIFT_THRESHOLD = 0.5
+
+# Everything needed to project new momenta: the training momenta, the eigenvalues/eigenvectors and the
+# centering terms of the training Gram matrix (its column means and overall mean)
+def build_model(momenta, gram, kpca, gamma=GAMMA, labels=None):
+    eigenvalues, eigenvectors = kpca_eigen(kpca)
+    model = {'momenta': np.asarray(momenta, dtype=np.float64),
+             'gamma': float(gamma),
+             'eigenvalues': np.asarray(eigenvalues, dtype=np.float64),
+             'eigenvectors': np.asarray(eigenvectors, dtype=np.float64),
+             'gram_column_means': gram.mean(axis=0),
+             'gram_mean': float(gram.mean())}
+    if labels is not None:
+        model['labels'] = np.asarray(labels, dtype=str)
+    return model
+
+# Fit a kPCA on the momenta and return its model and training scores
+def fit_model(momenta, gamma=GAMMA, n_components=N_COMPONENTS, eigen_solver=None, labels=None):
+    momenta = np.asarray(momenta, dtype=np.float64)
+    with span('kpca.gram'):
+        gram = rbf_gram(squared_distances(momenta), gamma)
+    kpca, scores = fit_kpca(gram, min(n_components, len(momenta) - 1), eigen_solver)
+    return build_model(momenta, gram, kpca, gamma, labels), scores
+
+def save_model(model, model_file):
+    temporary = model_file + '.tmp.npz'
+    np.savez(temporary, **model)
+    os.replace(temporary, model_file)
+    return model_file
+
+def load_model(model_file):
+    with np.load(model_file, allow_pickle=False) as data:
+        model = {key: data[key] for key in data.files}
+    model['gamma'] = float(model['gamma'])
+    model['gram_mean'] = float(model['gram_mean'])
+    return model
+
+# Kernel between new rows and the training momenta, centred with the training statistics
+def _centred_kernel(model, rows):
+    train = model['momenta']
+    sq = (np.einsum('ij,ij->i', rows, rows)[:, None] + np.einsum('ij,ij->i', train, train)[None, :]
+          - 2 * (rows @ train.T))
+    np.maximum(sq, 0, out=sq)
+    kernel = rbf_gram(sq, model['gamma'])
+    row_means = kernel.mean(axis=1)
+    kernel -= model['gram_column_means'][None, :]
+    kernel -= row_means[:, None]
+    kernel += model['gram_mean']
+    return kernel, row_means
+
+# Scores of new rows in the fitted space (the same as KernelPCA.transform), and the fraction of each row's
+# centred feature-space variance the fitted components leave out (0 for rows like the training set)
+def project(model, rows):
+    rows = np.asarray(rows, dtype=np.float64)
+    kernel, row_means = _centred_kernel(model, rows)
+    eigenvalues = model['eigenvalues']
+    scale = np.zeros_like(eigenvalues)
+    scale[eigenvalues > 0] = 1 / np.sqrt(eigenvalues[eigenvalues > 0])
+    scores = kernel @ (model['eigenvectors'] * scale)
+    # k(x, x) = 1 for the RBF kernel
+    total = np.maximum(1 - 2 * row_means + model['gram_mean'], np.finfo(float).tiny)
+    residual = np.clip(1 - np.sum(scores ** 2, axis=1) / total, 0, 1)
+    return scores, residual
+
+# Project momenta batch_size rows at a time; momenta may be a memory-mapped array, so only one batch is read
+# from disk at a time
+def project_batches(model, momenta, batch_size=BATCH_SIZE):
+    for start in range(0, len(momenta), batch_size):
+        with span('kpca.project'):
+            yield project(model, np.asarray(momenta[start:start + batch_size]))
+
+def project_momenta(model, momenta, batch_size=BATCH_SIZE):
+    batches = list(project_batches(model, momenta, batch_size))
+    if not batches:
+        return np.empty((0, len(model['eigenvalues']))), np.empty(0)
+    return np.concatenate([scores for scores, _ in batches]), np.concatenate([residual for _, residual in batches])
+
+# Match the components of a new fit to those of a reference fit, from the scores of the specimens both share:
+# components are paired by largest absolute correlation and flipped where the correlation is negative
+def align_components(reference_scores, scores):
+    n = min(reference_scores.shape[1], scores.shape[1])
+    a = reference_scores[:, :n] - reference_scores[:, :n].mean(axis=0)
+    b = scores[:, :n] - scores[:, :n].mean(axis=0)
+    norms = np.linalg.norm(a, axis=0)[:, None] * np.linalg.norm(b, axis=0)[None, :]
+    correlation = (a.T @ b) / np.where(norms > 0, norms, 1)
+    _, order = linear_sum_assignment(-np.abs(correlation))
+    signs = np.sign(correlation[np.arange(n), order])
+    signs[signs == 0] = 1
+    return np.concatenate([order, np.arange(n, scores.shape[1])]), np.concatenate([signs, np.ones(scores.shape[1] - n)])
+
+def _apply_alignment(model, order, signs):
+    model['eigenvalues'] = model['eigenvalues'][order]
+    model['eigenvectors'] = model['eigenvectors'][:, order] * signs
+    return model
+
+# Reorder/flip the components of a fitted KernelPCA and its scores in place of a previous fit
+def align_kpca(kpca, X_kpca, reference_scores):
+    order, signs = align_components(reference_scores, X_kpca)
+    for eigenvalues_name, eigenvectors_name in (('eigenvalues_', 'eigenvectors_'), ('lambdas_', 'alphas_')):
+        if hasattr(kpca, eigenvalues_name):
+            setattr(kpca, eigenvalues_name, getattr(kpca, eigenvalues_name)[order])
+            setattr(kpca, eigenvectors_name, getattr(kpca, eigenvectors_name)[:, order] * signs)
+    return kpca, X_kpca[:, order] * signs
+
+# Project new momenta, refitting on training + new momenta when their mean residual exceeds the drift threshold.
+# The refit components are matched to the old ones (order and sign) using the training specimens' scores.
+# Returns the model, the scores of the new rows and whether it was refitted.
+def project_or_refit(model, momenta, drift_threshold=DRIFT_THRESHOLD, batch_size=BATCH_SIZE, labels=None):
+    scores, residual = project_momenta(model, momenta, batch_size)
+    drift = float(residual.mean()) if len(residual) else 0.0
+    print(f"Projected {len(scores)} specimens, mean residual {drift:.3f} (threshold {drift_threshold})")
+    if drift <= drift_threshold:
+        return model, scores, False
+    combined = np.concatenate([model['momenta'], np.asarray(momenta, dtype=np.float64)])
+    combined_labels = None
+    if labels is not None and 'labels' in model:
+        combined_labels = np.concatenate([model['labels'], np.asarray(labels, dtype=str)])
+    n_components = len(model['eigenvalues'])
+    reference, _ = project_momenta(model, model['momenta'], batch_size)
+    refit, refit_scores = fit_model(combined, model['gamma'], n_components, labels=combined_labels)
+    order, signs = align_components(reference, refit_scores[:len(reference)])
+    refit = _apply_alignment(refit, order, signs)
+    print(f"Refitted on {len(combined)} specimens")
+    return refit, refit_scores[len(reference):][:, order] * signs, True
+
+# Scores in the kpca.csv layout (one PC column per component)
+def scores_table(scores, labels=None):
+    table = pd.DataFrame(scores, columns=['PC{}'.format(idx+1) for idx in range(scores.shape[1])])
+    if labels is not None:
+        table.insert(0, 'Tip_Label', labels)
+    return table
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Project new momenta into a saved kPCA space.')
+    parser.add_argument('model', help='kpca_model.npz saved by the landmark-free analysis (--save-model)')
+    parser.add_argument('momenta_file', help='Deformetrica momenta .txt of the new specimens')
+    parser.add_argument('--output', default='projected_kpca.csv', help='scores .csv')
+    parser.add_argument('--labels', default=None, help='.csv whose first column names the new specimens')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--refit-threshold', type=float, default=None,
+                        help='refit (and overwrite the model) when the mean residual exceeds this, e.g. ' + str(DRIFT_THRESHOLD))
+    args = parser.parse_args(argv)
+
+    model = load_model(args.model)
+    momenta = load_momenta(args.momenta_file)
+    labels = pd.read_csv(args.labels).iloc[:, 0].astype(str).to_numpy() if args.labels else None
+    if args.refit_threshold is None:
+        scores, residual = project_momenta(model, momenta, args.batch_size)
+    else:
+        model, scores, refitted = project_or_refit(model, momenta, args.refit_threshold, args.batch_size, labels)
+        if refitted:
+            save_model(model, args.model)
+        _, residual = project_momenta(model, momenta, args.batch_size)
+    table = scores_table(scores, labels)
+    table['Residual'] = residual
+    table.to_csv(args.output, index=False)
+    print(f"Scores of {len(table)} specimens written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -4,97 +4,52 @@
 
 # Author: James M. Mulqueeney
 
-# Date Last Modified: 13/03/2024
-
-%matplotlib inline
+# Date Last Modified: 18/10/2026
 
 ### General Imports
-import matplotlib.pyplot as plt
-from glob import glob as glob
-import numpy as np
-import pandas as pd
 import os
-import matplotlib.cm as cm
-
-### VTK imports
-import vtk
-from vtk import vtkPolyDataReader
-from vtk import vtkPolyDataWriter
-from vtk import vtkUnstructuredGridReader
-from vtk import vtkUnstructuredGridWriter
-from vtk import vtkPolyData
-from vtk import vtkPoints
-from vtk import vtkCellArray
-from vtk import vtkProcrustesAlignmentFilter as Procrustes
-from vtk import vtkMultiBlockDataGroupFilter as GroupFilter
-from vtk import vtkLandmarkTransform
-from vtk import vtkTransformPolyDataFilter as TransformFilter
-from vtk.util import vtkConstants
-from vtk import vtkIdList
-from vtk import vtkIdTypeArray
-from vtk import vtkTriangle
-from vtk import vtkFloatArray
-from vtk import vtkTetra
-from vtk import vtkMath
-
-# Load Data
-working_directory = os.path.join(os.getcwd())
-
-controlpoints = np.loadtxt(os.path.join(working_directory, 'DeterministicAtlas__EstimatedParameters__ControlPoints.txt'))
-f = open(os.path.join(working_directory, 'DeterministicAtlas__EstimatedParameters__Momenta.txt'))
-first_line = f.readline().split(' ')
-number_of_subjects = int(first_line[0])
-number_of_controlpoints = int(first_line[1])
-dimension = int(first_line[2])
-f.close()
-momenta = np.loadtxt(os.path.join(working_directory, os.path.join(working_directory, 'DeterministicAtlas__EstimatedParameters__Momenta.txt')), 
-                     skiprows=2)
-momenta_linearised = momenta.reshape([number_of_subjects, dimension*number_of_controlpoints])
-
-print('Control Points: {}'.format(number_of_controlpoints))
-print('Subjects: {}'.format(number_of_subjects))
-print('Dimension: {}'.format(dimension))
-
-# Define populations
-df = pd.read_csv (os.path.join(working_directory, 'data.csv'))
-df
-
-# Kernel PCA
-from matplotlib import pyplot as plt
-from sklearn.decomposition import PCA, KernelPCA
-from sklearn.svm import SVC
-from sklearn.model_selection import permutation_test_score
-from sklearn.model_selection import StratifiedKFold
-from sklearn.model_selection import cross_val_score
-fig = plt.figure(figsize=(7,5))
-idx = [0,1]
-
-n_permutations=1000
-
-kpca = KernelPCA(kernel="rbf", fit_inverse_transform=True, n_components=321, gamma=.0000025)
-X_kpca = kpca.fit_transform(momenta_linearised)
-
-for i in range(X_kpca.shape[1]):
-    df['PC{}'.format(i+1)] = X_kpca[:, i]
-
-# Eigenvalues
-eigenvalues = kpca.lambdas_
-eigenvectors = kpca.alphas_ / np.linalg.norm(kpca.alphas_, axis=0)
-
-eig = pd.DataFrame()
-eig['PCA dimension'] = ['PC{}'.format(idx+1) for idx in range(len(eigenvalues))]
-eig['cum. variability (in %)'] = 100 * np.cumsum(eigenvalues) / np.sum(eigenvalues)
-pd.set_option('precision', 2)
-eig['lambda'] = eigenvalues
-eig['alpha'] = list(np.transpose(eigenvectors))
-
-eig
-eig.to_csv(os.path.join(working_directory, 'eigenvalues.csv'))
-
-# Write PCA points on disk
-
-for idx in range(X_kpca.shape[1]):
-    df['PC{}'.format(idx+1)] = X_kpca[:, idx]
-    
-df.to_csv(os.path.join(working_directory, 'kpca.csv'))
-df
+import argparse
+
+### Analysis (importable: Landmark_Free_Sweep.run_analysis, or run_sweep for a whole results tree).
+### The analysis modules pull in numpy, pandas and scikit-learn, so they are imported once the arguments are parsed
+### and unset options take the paper's settings from Kernel_PCA_Engine and Permutation_Testing
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate kpca.csv and eigenvalues.csv for one Deformetrica output folder.')
+    parser.add_argument('working_directory', nargs='?', default=os.getcwd(),
+                        help='folder with the Deformetrica momenta and data.csv (default: current directory)')
+    parser.add_argument('--gamma', type=float, default=None, help='default: Kernel_PCA_Engine.GAMMA')
+    parser.add_argument('--n-components', type=int, default=None, help='default: Kernel_PCA_Engine.N_COMPONENTS')
+    parser.add_argument('--fit-inverse-transform', action='store_true')
+    parser.add_argument('--save-model', action='store_true',
+                        help='save the fit to kpca_model.npz for projecting new specimens (Kernel_PCA_Projection.py)')
+    parser.add_argument('--permutation-test', nargs='*', metavar='GROUP', default=None,
+                        help='test group separation on the kPCA scores for these data.csv columns (default: Diet Locomotion)')
+    parser.add_argument('--n-permutations', type=int, default=None, help='default: Permutation_Testing.N_PERMUTATIONS')
+    args = parser.parse_args(argv)
+    from Deformetrica_Parameter_Loader import read_momenta_header, MOMENTA_FILE
+    from Kernel_PCA_Engine import GAMMA, N_COMPONENTS
+    from Landmark_Free_Sweep import run_analysis
+    from Permutation_Testing import run_group_tests, GROUP_COLUMNS, N_PERMUTATIONS
+
+    # Load Data
+    number_of_subjects, number_of_controlpoints, dimension = read_momenta_header(os.path.join(args.working_directory, MOMENTA_FILE))
+    print('Control Points: {}'.format(number_of_controlpoints))
+    print('Subjects: {}'.format(number_of_subjects))
+    print('Dimension: {}'.format(dimension))
+
+    # Kernel PCA, eigenvalues and PCA points written to disk
+    df, eig = run_analysis(args.working_directory, gamma=GAMMA if args.gamma is None else args.gamma,
+                           n_components=args.n_components or N_COMPONENTS,
+                           fit_inverse_transform=args.fit_inverse_transform, save_model=args.save_model)
+    print(eig[['PCA dimension', 'cum. variability (in %)', 'lambda']].head(10).to_string(index=False))
+    print('kpca.csv and eigenvalues.csv written to {}'.format(args.working_directory))
+
+    # Permutation test of the separation of the diet/locomotion groups on the kPCA scores
+    if args.permutation_test is not None:
+        run_group_tests(os.path.join(args.working_directory, 'kpca.csv'), args.permutation_test or GROUP_COLUMNS,
+                        os.path.join(args.working_directory, 'permutation_tests.csv'),
+                        n_permutations=args.n_permutations or N_PERMUTATIONS)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for running the momenta -> kPCA -> .csv analysis over every Deformetrica output folder in a results tree
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from Pipeline_Instrumentation import span, report
+from Deformetrica_Parameter_Loader import load_momenta, MOMENTA_FILE
+from Kernel_PCA_Engine import fit_kpca, rbf_gram, squared_distances, export_results, GAMMA, N_COMPONENTS
+import Kernel_PCA_Projection as projection
+
+POPULATION_FILE = 'data.csv'
+OUTPUT_FILES = ('kpca.csv', 'eigenvalues.csv')
+MANIFEST_FILE = 'landmark_free_manifest.json'
+
+# Generate kpca.csv and eigenvalues.csv for one Deformetrica output folder. With save_model=True the fit is also
+# saved to kpca_model.npz (for Kernel_PCA_Projection), and if a model is already there the new components are
+# matched to it so the PC order and signs do not change between runs
+def run_analysis(working_directory, gamma=GAMMA, n_components=N_COMPONENTS, eigen_solver=None,
+                 fit_inverse_transform=False, save_model=False):
+    with span('landmark_free', os.path.basename(os.path.normpath(working_directory))):
+        return _run_analysis(working_directory, gamma, n_components, eigen_solver, fit_inverse_transform, save_model)
+
+def _run_analysis(working_directory, gamma, n_components, eigen_solver, fit_inverse_transform, save_model=False):
+    momenta = load_momenta(os.path.join(working_directory, MOMENTA_FILE), linearise=False)
+    number_of_subjects, number_of_controlpoints, dimension = momenta.shape
+    momenta_linearised = momenta.reshape([number_of_subjects, dimension*number_of_controlpoints])
+
+    # Define populations
+    df = pd.read_csv(os.path.join(working_directory, POPULATION_FILE))
+
+    gram = None
+    if fit_inverse_transform:
+        kpca, X_kpca = fit_kpca(n_components=n_components, fit_inverse_transform=True,
+                                momenta=momenta_linearised, gamma=gamma)
+    else:
+        with span('kpca.gram'):
+            gram = rbf_gram(squared_distances(momenta_linearised), gamma)
+        kpca, X_kpca = fit_kpca(gram, n_components, eigen_solver)
+
+    if save_model:
+        model_file = os.path.join(working_directory, projection.MODEL_FILE)
+        if os.path.exists(model_file):
+            previous = projection.load_model(model_file)
+            if previous['momenta'].shape[1] == momenta_linearised.shape[1]:
+                kpca, X_kpca = projection.align_kpca(kpca, X_kpca,
+                                                     projection.project_momenta(previous, momenta_linearised)[0])
+        if gram is None:
+            gram = rbf_gram(squared_distances(momenta_linearised), gamma)
+        labels = df['Tip_Label'].astype(str).to_numpy() if 'Tip_Label' in df.columns else None
+        projection.save_model(projection.build_model(momenta_linearised, gram, kpca, gamma, labels), model_file)
+    with span('landmark_free.export'):
+        return export_results(working_directory, df, kpca, X_kpca)
+
+# Folders holding both the Deformetrica momenta and the population table
+def find_analysis_folders(results_dir):
+    return sorted(root for root, dirs, files in os.walk(results_dir)
+                  if MOMENTA_FILE in files and POPULATION_FILE in files)
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+# Size and modification time of the inputs, used to decide whether a folder needs to be re-run
+def input_signature(folder):
+    signature = {}
+    for name in (MOMENTA_FILE, POPULATION_FILE):
+        stat = os.stat(os.path.join(folder, name))
+        signature[name] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+def is_up_to_date(folder, entry, parameters):
+    return (entry is not None and entry.get('parameters') == parameters
+            and entry.get('inputs') == input_signature(folder)
+            and all(os.path.exists(os.path.join(folder, name)) for name in OUTPUT_FILES))
+
+def _run_folder(folder, parameters):
+    inputs = input_signature(folder)
+    start = time.perf_counter()
+    df, eig = run_analysis(folder, **parameters)
+    return {'inputs': inputs,
+            'parameters': parameters,
+            'subjects': len(df),
+            'components': len(eig),
+            'seconds': round(time.perf_counter() - start, 3),
+            'outputs': {name: file_sha256(os.path.join(folder, name)) for name in OUTPUT_FILES}}
+
+# Run the pending (key, folder) pairs, yielding (key, record, error) as each folder finishes, so one failing
+# folder neither stops the others nor loses their records
+def _run_pending(pending, parameters, n_workers):
+    if n_workers == 1 or len(pending) < 2:
+        for key, folder in pending:
+            try:
+                yield key, _run_folder(folder, parameters), None
+            except Exception as error:
+                yield key, None, error
+        return
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(_run_folder, folder, parameters): key for key, folder in pending}
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], None if error else future.result(), error
+
+def _write_manifest(manifest, manifest_file):
+    temporary = manifest_file + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temporary, manifest_file)
+
+# Run every folder whose inputs or parameters changed since the last sweep, n_workers at a time, and record
+# timings and output hashes in the manifest as each folder finishes. Folders that fail lose their record (so they
+# are re-run next time) and are listed in the RuntimeError raised once the others are done
+def run_sweep(results_dir, gamma=GAMMA, n_components=N_COMPONENTS, eigen_solver=None, n_workers=None,
+              force=False, manifest_file=None):
+    manifest_file = manifest_file or os.path.join(results_dir, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    parameters = {'gamma': gamma, 'n_components': n_components, 'eigen_solver': eigen_solver}
+
+    folders = find_analysis_folders(results_dir)
+    keys = [os.path.relpath(folder, results_dir) for folder in folders]
+    pending = [(key, folder) for key, folder in zip(keys, folders)
+               if force or not is_up_to_date(folder, manifest.get(key), parameters)]
+    pending_keys = {key for key, _ in pending}
+    for key in keys:
+        if key not in pending_keys:
+            print(f"Skipping {key} (up to date)")
+
+    start = time.perf_counter()
+    failures = {}
+    for key, record, error in _run_pending(pending, parameters, n_workers):
+        if error is not None:
+            failures[key] = error
+            manifest.pop(key, None)
+            print(f"Failed {key}: {error!r}")
+        else:
+            manifest[key] = record
+            print(f"Analysed {key}: {record['subjects']} subjects in {record['seconds']:.2f} s")
+        _write_manifest(manifest, manifest_file)
+
+    report()
+    print(f"Ran {len(pending) - len(failures)} of {len(folders)} folders in {time.perf_counter() - start:.2f} s, "
+          f"manifest: {manifest_file}")
+    if failures:
+        raise RuntimeError("{} of {} folders failed: {}".format(
+            len(failures), len(pending), '; '.join(f"{key}: {error!r}" for key, error in sorted(failures.items()))))
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the landmark-free kPCA analysis for every Deformetrica output folder in a results tree.')
+    parser.add_argument('results_dir', help='folder searched for DeterministicAtlas__EstimatedParameters__Momenta.txt + data.csv')
+    parser.add_argument('--gamma', type=float, default=GAMMA)
+    parser.add_argument('--n-components', type=int, default=N_COMPONENTS)
+    parser.add_argument('--eigen-solver', choices=['dense', 'arpack', 'randomized'], default=None,
+                        help='default: dense (exact); randomized/arpack only approximate the leading components')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='re-run folders even if their inputs have not changed')
+    parser.add_argument('--manifest', default=None, help='manifest path (default: <results_dir>/' + MANIFEST_FILE + ')')
+    args = parser.parse_args(argv)
+    run_sweep(args.results_dir, args.gamma, args.n_components, args.eigen_solver, args.workers, args.force, args.manifest)
+
+if __name__ == '__main__':
+    main()
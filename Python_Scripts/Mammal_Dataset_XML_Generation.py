@@ -4,40 +4,31 @@
 
 # Author: James M. Mulqueeney
 
-# Date Last Modified: 13/03/2024
+# Date Last Modified: 18/10/2026
 
 # Load in Libraries 
-import os
-from xml.etree.ElementTree import Element, SubElement, tostring
-
-# Define the directory containing the files
-directory = 'F:/aligned-binary-meshes/Yichen Meshes/VTK Files'
-
-# Create a list to store the file names
-file_list = []
-
-# Iterate through the directory and add VTK files to the list
-for filename in os.listdir(directory):
-    if filename.endswith('.vtk'):
-        file_list.append(filename)
-
-# Sort the file names in alphabetical order
-sorted_files = sorted(file_list)
-
-# Create a string for the XML data
-xml_data = '<?xml version="1.0"?>\n<data-set>\n'
-
-# Iterate through the sorted file names and add subject elements
-for filename in sorted_files:
-    xml_data += '    <subject id="' + filename + '">\n'
-    xml_data += '        <visit id="cranium">\n'
-    xml_data += '            <filename object_id="cranium">' + filename + '</filename>\n'
-    xml_data += '        </visit>\n'
-    xml_data += '    </subject>\n'
-
-# Close the root element
-xml_data += '</data-set>\n'
-
-# Write the XML data to a file
-with open('data_set.xml', 'w') as f:
-    f.write(xml_data)
+from xml.etree.ElementTree import Element, SubElement, tostring, indent
+from Specimen_Catalog import specimen_filenames
+
+# Write the data_set.xml file with one subject per mesh file
+def write_data_set_xml(sorted_files, output_file='data_set.xml'):
+    # Build the XML tree
+    root = Element('data-set')
+
+    # Iterate through the sorted file names and add subject elements
+    for filename in sorted_files:
+        subject = SubElement(root, 'subject', id=filename)
+        visit = SubElement(subject, 'visit', id='cranium')
+        SubElement(visit, 'filename', object_id='cranium').text = filename
+
+    # Indent as Deformetrica's example data sets and write the XML data to a file
+    indent(root, space='    ')
+    with open(output_file, 'w') as f:
+        f.write('<?xml version="1.0"?>\n' + tostring(root, encoding='unicode') + '\n')
+
+if __name__ == '__main__':
+    # Define the directory containing the files
+    directory = 'F:/aligned-binary-meshes/Yichen Meshes/VTK Files'
+
+    # Query the specimen catalog (only new or changed meshes are re-read)
+    write_data_set_xml(specimen_filenames(directory, 'vtk'), 'data_set.xml')
@@ -1,38 +1,174 @@
-# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania 
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
 
-# Code for decimating and smoothing meshes 
+# Code for decimating and smoothing meshes
 
 # Author: James M. Mulqueeney
 
-# Date Last Modified: 13/03/2024
+# Date Last Modified: 18/10/2026
 
-# Load in Libraries 
+# Load in Libraries
 import os
+import csv
+import json
+import time
+from functools import partial
+from multiprocessing import Pool
 import numpy as np
-from skimage import io
-from skimage import measure
+import scipy.sparse
 import trimesh
+from Pipeline_Instrumentation import span, report, peak_memory_mb
+from Stage_Cache import cached_call, summarise_hits, CACHE_BUDGET_MB
 
-# Define input and output directories 
-input_dir = "E:\CTData\James Mulqueeney\Mammalian Data\Placental Mammalian Data\Original Files\Aligned Mesh Files"
-output_dir = r"E:\CTData\James Mulqueeney\Mammalian Data\Placental Mammalian Data\Decimated Meshes\100,000 Faces"
+# Smoothing and decimation settings
+LAMB = 0.5
+ITERATIONS = 10
+FACE_COUNT = 50000
 
-# Create output directory if it does not exist
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
+# Settings each output in the output folder was made with, so outputs are redone when a setting changes
+MANIFEST_FILE = 'decimation_manifest.json'
 
-# Loop through input directory
-for filename in os.listdir(input_dir):
-    if filename.endswith('.ply'):
+STATS_COLUMNS = ["Mesh File", "Wall Time (s)", "Peak Memory (MB)", "Vertices Before", "Faces Before",
+                 "Vertices After", "Faces After"]
+
+# Equal-weight Laplacian operator built from the directed face edges as trimesh.smoothing.laplacian_calculation
+# does: duplicates are summed, so on open meshes the boundary neighbours get the same weights as in trimesh
+def sparse_laplacian(mesh):
+    edges = mesh.edges
+    n = len(mesh.vertices)
+    adjacency = scipy.sparse.csr_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n, n))
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    degree[degree == 0] = 1
+    return scipy.sparse.diags(1.0 / degree) @ adjacency
+
+# Vectorised equivalent of trimesh.smoothing.filter_laplacian (explicit integration with the volume constraint)
+def filter_laplacian_sparse(mesh, lamb=LAMB, iterations=ITERATIONS):
+    laplacian = sparse_laplacian(mesh)
+    vol_ini = mesh.volume
+    center_mass = mesh.center_mass
+    vertices = np.array(mesh.vertices, dtype=np.float64)
+    faces = mesh.faces.view(np.ndarray)
+    for _ in range(iterations):
+        vertices += lamb * (laplacian @ vertices - vertices)
+        # Restore the initial volume by rescaling about the centre of mass
+        vol_new = trimesh.triangles.mass_properties(vertices[faces], skip_inertia=True)['volume']
+        scale = (vol_ini / vol_new) ** (1.0 / 3.0)
+        vertices = (vertices - center_mass) * scale + center_mass
+    mesh.vertices = vertices
+    return mesh
+
+# Quadric decimation (renamed simplify_quadric_decimation in newer trimesh releases)
+def decimate(mesh, face_count=FACE_COUNT):
+    if hasattr(mesh, 'simplify_quadric_decimation'):
+        return mesh.simplify_quadric_decimation(face_count=face_count)
+    return mesh.simplify_quadratic_decimation(face_count)
+
+# Smooth (in place) and decimate a loaded mesh
+def smooth_and_decimate(mesh, smoothing='trimesh', lamb=LAMB, iterations=ITERATIONS, face_count=FACE_COUNT):
+    # Smooth the mesh
+    with span('decimate.smooth'):
+        if smoothing == 'sparse':
+            smoothed_mesh = filter_laplacian_sparse(mesh, lamb=lamb, iterations=iterations)
+        else:
+            smoothed_mesh = trimesh.smoothing.filter_laplacian(mesh, lamb=lamb, iterations=iterations)
+    # Decimate the mesh
+    with span('decimate.simplify'):
+        return decimate(smoothed_mesh, face_count)
+
+# Smooth and decimate one mesh, returning a row of the statistics table
+def process_mesh(input_path, output_path, smoothing='trimesh', lamb=LAMB, iterations=ITERATIONS,
+                 face_count=FACE_COUNT):
+    start = time.perf_counter()
+    with span('decimate', os.path.basename(input_path)):
         # Load the input mesh
-        mesh = trimesh.load(os.path.join(input_dir, filename))
-        # Smooth the mesh
-        smoothed_mesh = trimesh.smoothing.filter_laplacian(mesh, lamb=0.5, iterations=10) 
-        # Decimate the mesh
-        decimated_mesh = smoothed_mesh.simplify_quadratic_decimation(50000)
-        # Define output file path
-        output_filepath = os.path.join(output_dir, os.path.splitext(filename)[0] + '.ply')
-        # Save the processed mesh
-        decimated_mesh.export(output_filepath)
+        with span('decimate.load', inputs=[input_path]):
+            mesh = trimesh.load(input_path)
+        vertices_before, faces_before = len(mesh.vertices), len(mesh.faces)
+        decimated_mesh = smooth_and_decimate(mesh, smoothing, lamb, iterations, face_count)
+        # Save the processed mesh, renaming at the end so an interrupted run never leaves a partial output
+        with span('decimate.export', outputs=[output_path]):
+            temporary_path = output_path + '.tmp'
+            decimated_mesh.export(temporary_path, file_type='ply')
+            os.replace(temporary_path, output_path)
+    return [os.path.basename(input_path), round(time.perf_counter() - start, 3), round(peak_memory_mb(), 1),
+            vertices_before, faces_before, len(decimated_mesh.vertices), len(decimated_mesh.faces)]
+
+# With a cache, meshes already smoothed and decimated with the same settings are copied from it instead
+def _process_task(task):
+    input_path, output_path, smoothing, lamb, iterations, face_count, cache_dir, cache_budget_mb = task
+    if cache_dir is None:
+        return False, process_mesh(input_path, output_path, smoothing, lamb, iterations, face_count)
+    params = {'smoothing': smoothing, 'lamb': lamb, 'iterations': iterations, 'face_count': face_count}
+    return cached_call(cache_dir, 'decimate', partial(process_mesh, smoothing=smoothing, lamb=lamb,
+                                                      iterations=iterations, face_count=face_count),
+                       input_path, output_path, params, cache_budget_mb)
+
+# An output is up to date when it is newer than its input and was made with the same settings
+def is_up_to_date(input_path, output_path, parameters=None, recorded=None):
+    return (os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+            and recorded == parameters)
+
+def _read_manifest(manifest_file):
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            return json.load(f)
+    return {}
+
+def _write_manifest(manifest, manifest_file):
+    temporary = manifest_file + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temporary, manifest_file)
+
+# Process every .ply in input_dir with n_workers processes (all cores by default), skipping up-to-date outputs
+# (the settings of every output are kept in decimation_manifest.json in the output folder). With a cache the
+# cache decides instead: every mesh goes through it, and outputs made with other settings are never reused.
+# Each mesh runs in a fresh worker process so the recorded peak memory is that of the mesh alone,
+# and each row is appended to the statistics file as soon as the mesh is done (cache hits add no row).
+def batch_process(input_dir, output_dir, n_workers=None, smoothing='trimesh', stats_file=None, force=False,
+                  lamb=LAMB, iterations=ITERATIONS, face_count=FACE_COUNT, cache_dir=None,
+                  cache_budget_mb=CACHE_BUDGET_MB):
+    # Create output directory if it does not exist
+    os.makedirs(output_dir, exist_ok=True)
+    stats_file = stats_file or os.path.join(output_dir, 'decimation_stats.csv')
+    manifest_file = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = _read_manifest(manifest_file)
+    parameters = {'smoothing': smoothing, 'lamb': lamb, 'iterations': iterations, 'face_count': face_count}
+
+    tasks = []
+    for filename in sorted(os.listdir(input_dir)):
+        if filename.endswith('.ply'):
+            input_path = os.path.join(input_dir, filename)
+            output_path = os.path.join(output_dir, os.path.splitext(filename)[0] + '.ply')
+            if (force or cache_dir is not None
+                    or not is_up_to_date(input_path, output_path, parameters, manifest.get(filename))):
+                tasks.append((input_path, output_path, smoothing, lamb, iterations, face_count, cache_dir,
+                              cache_budget_mb))
+            else:
+                print(f"Skipping {filename} (up to date)")
+
+    write_header = not os.path.exists(stats_file)
+    with open(stats_file, 'a', newline='') as file, Pool(n_workers, maxtasksperchild=1) as pool:
+        writer = csv.writer(file)
+        if write_header:
+            writer.writerow(STATS_COLUMNS)
+        hits = []
+        for task, (hit, row) in zip(tasks, pool.imap(_process_task, tasks)):
+            hits.append(hit)
+            manifest[os.path.basename(task[0])] = parameters
+            _write_manifest(manifest, manifest_file)
+            if hit:
+                print(f"{os.path.basename(task[0])}: cache hit")
+                continue
+            writer.writerow(row)
+            file.flush()
+            print(f"{row[0]}: {row[4]} -> {row[6]} faces in {row[1]:.1f} s, peak {row[2]:.0f} MB")
+    if cache_dir is not None:
+        summarise_hits('decimate', hits)
+    report()
 
+if __name__ == '__main__':
+    # Define input and output directories
+    input_dir = "E:\CTData\James Mulqueeney\Mammalian Data\Placental Mammalian Data\Original Files\Aligned Mesh Files"
+    output_dir = r"E:\CTData\James Mulqueeney\Mammalian Data\Placental Mammalian Data\Decimated Meshes\100,000 Faces"
 
+    batch_process(input_dir, output_dir)
@@ -0,0 +1,178 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for streaming each specimen through smoothing -> decimation -> centroid size -> .vtk/.tif export in memory,
+# writing only the final files (no intermediate .ply/.vtk round-trips between the stages)
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import time
+import queue
+import threading
+import numpy as np
+import trimesh
+import vtk
+import pyvista as pv
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+from Batch_Mesh_Centroid_Measurement_v1 import centroid_size, save_to_csv
+from Mesh_Decimation_Smoothing import smooth_and_decimate, LAMB, ITERATIONS, FACE_COUNT
+from New_Folder_Batch_Ply_to_VTK_Convert import write_polydata, EXTENSIONS
+from Variable_Batch_Mesh_to_Label_File_Convertor_final import voxelise_trimesh_slabs, MEMORY_BUDGET_MB, PITCH_DIVISOR
+
+_DONE = object()
+# Seconds a blocked producer waits before checking whether the consumer has stopped
+PUT_TIMEOUT = 0.1
+
+# Zero-copy trimesh -> VTK: the vtkPoints and the cell connectivity wrap the trimesh arrays
+# (the VTK arrays keep a reference to them, so they stay valid after the mesh is gone).
+# points_dtype=np.float32 copies the points to single precision, as vtkPLYReader reads them in the file-based chain
+def trimesh_to_polydata(mesh, points_dtype=np.float64):
+    vertices = np.ascontiguousarray(mesh.vertices.view(np.ndarray), dtype=points_dtype)
+    faces = np.ascontiguousarray(mesh.faces.view(np.ndarray), dtype=np.int64)
+    points = vtk.vtkPoints()
+    points.SetData(numpy_to_vtk(vertices, deep=False))
+    offsets = np.arange(0, faces.size + 1, 3, dtype=np.int64)
+    cells = vtk.vtkCellArray()
+    # vtkTypeInt64Array cell arrays, written as vtktypeint64 like those vtkPLYReader makes
+    cells.SetData(numpy_to_vtk(offsets, deep=False, array_type=vtk.VTK_TYPE_INT64),
+                  numpy_to_vtk(faces.ravel(), deep=False, array_type=vtk.VTK_TYPE_INT64))
+    polydata = vtk.vtkPolyData()
+    polydata.SetPoints(points)
+    polydata.SetPolys(cells)
+    return polydata
+
+# Zero-copy VTK -> trimesh for triangle meshes: the vertex and face arrays are views of the VTK arrays
+def polydata_to_trimesh(polydata):
+    vertices = vtk_to_numpy(polydata.GetPoints().GetData())
+    faces = vtk_to_numpy(polydata.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+    return trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+
+# pyvista wraps VTK objects without copying
+def trimesh_to_pyvista(mesh):
+    return pv.wrap(trimesh_to_polydata(mesh))
+
+# Run an iterator in a background thread, keeping up to depth items ready (e.g. the next mesh is read from disk
+# while the current one is being processed). When the consumer stops early (an error or a break), the producer
+# stops too instead of blocking on the full queue, and the items still queued are released
+def prefetch(iterable, depth=1):
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    # Put an item unless the consumer has stopped; False once it has
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as error:
+            put(error)
+        finally:
+            put(_DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        while True:
+            try:
+                items.get_nowait()
+            except queue.Empty:
+                break
+
+# Each stage takes and yields specimen records: dicts holding the name, the current mesh and the results so far
+
+def load_meshes(paths):
+    for path in paths:
+        start = time.perf_counter()
+        mesh = trimesh.load(path)
+        yield {'name': os.path.splitext(os.path.basename(path))[0], 'mesh': mesh,
+               'vertices_before': len(mesh.vertices), 'faces_before': len(mesh.faces),
+               'read_time': time.perf_counter() - start}
+
+def smooth_decimate_stage(specimens, smoothing='trimesh', lamb=LAMB, iterations=ITERATIONS, face_count=FACE_COUNT):
+    for specimen in specimens:
+        start = time.perf_counter()
+        specimen['mesh'] = smooth_and_decimate(specimen['mesh'], smoothing, lamb, iterations, face_count)
+        specimen['faces_after'] = len(specimen['mesh'].faces)
+        specimen['decimate_time'] = time.perf_counter() - start
+        yield specimen
+
+def centroid_stage(specimens):
+    for specimen in specimens:
+        specimen['centroid_size'] = centroid_size(specimen['mesh'].vertices.view(np.ndarray))
+        yield specimen
+
+def vtk_export_stage(specimens, output_dir, file_format='ascii'):
+    for specimen in specimens:
+        start = time.perf_counter()
+        specimen['vtk_file'] = specimen['name'] + EXTENSIONS[file_format]
+        # Single-precision points, as the .ply -> .vtk conversion writes them
+        write_polydata(trimesh_to_polydata(specimen['mesh'], np.float32),
+                       os.path.join(output_dir, specimen['vtk_file']), file_format)
+        specimen['export_time'] = time.perf_counter() - start
+        yield specimen
+
+def voxel_export_stage(specimens, output_dir, memory_budget_mb=MEMORY_BUDGET_MB, pitch_divisor=PITCH_DIVISOR):
+    for specimen in specimens:
+        start = time.perf_counter()
+        voxelise_trimesh_slabs(specimen['mesh'], os.path.join(output_dir, specimen['name'] + '.tif'),
+                               memory_budget_mb, pitch_divisor)
+        specimen['voxel_time'] = time.perf_counter() - start
+        yield specimen
+
+# Chain the stages for every .ply in input_dir. Returns the generator; nothing runs until it is consumed
+def specimen_stream(input_dir, output_dir, smoothing='trimesh', face_count=FACE_COUNT, file_format='ascii',
+                    voxel_dir=None, pitch_divisor=PITCH_DIVISOR, prefetch_depth=1):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(input_dir, f) for f in sorted(os.listdir(input_dir)) if f.endswith('.ply')]
+    stream = prefetch(load_meshes(paths), prefetch_depth)
+    stream = smooth_decimate_stage(stream, smoothing, face_count=face_count)
+    stream = centroid_stage(stream)
+    stream = vtk_export_stage(stream, output_dir, file_format)
+    if voxel_dir is not None:
+        os.makedirs(voxel_dir, exist_ok=True)
+        stream = voxel_export_stage(stream, voxel_dir, pitch_divisor=pitch_divisor)
+    return stream
+
+# Run the stream and write the centroid sizes of the exported meshes
+def run_pipeline(input_dir, output_dir, smoothing='trimesh', face_count=FACE_COUNT, file_format='ascii',
+                 voxel_dir=None, pitch_divisor=PITCH_DIVISOR, centroid_csv=None):
+    start = time.perf_counter()
+    centroid_sizes = []
+    for specimen in specimen_stream(input_dir, output_dir, smoothing, face_count, file_format, voxel_dir,
+                                    pitch_divisor):
+        # Drop the mesh as soon as it is written
+        del specimen['mesh']
+        centroid_sizes.append((specimen['vtk_file'], specimen['centroid_size']))
+        print(f"{specimen['name']}: {specimen['faces_before']} -> {specimen['faces_after']} faces, "
+              f"centroid size {specimen['centroid_size']:.4f}")
+    save_to_csv(centroid_sizes, centroid_csv or os.path.join(output_dir, 'Mesh_centroid_sizes.csv'))
+    print(f"Processed {len(centroid_sizes)} meshes in {time.perf_counter() - start:.2f} s")
+    return centroid_sizes
+
+if __name__ == '__main__':
+    # Example usage
+    input_dir = "E:/CTData/James Mulqueeney/Mammalian Data/Placental Mammalian Data/Original Files/Aligned Mesh Files"
+    output_dir = "E:/CTData/James Mulqueeney/Mammalian Data/Placental Mammalian Data/VTK Files"
+
+    run_pipeline(input_dir, output_dir)
@@ -1,39 +1,145 @@
-# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania 
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
 
-# Code for batch converting .ply files into .vtk format 
+# Code for batch converting .ply files into .vtk format
 
 # Author: James M. Mulqueeney
 
-# Date Last Modified: 13/03/2024
+# Date Last Modified: 18/10/2026
 
-# Load in libraries 
+# Load in libraries
 import os
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import vtk
+from Pipeline_Instrumentation import span, report
+from Stage_Cache import cached_call, summarise_hits, CACHE_BUDGET_MB
+from Mammal_Dataset_XML_Generation import write_data_set_xml
+from Write_Data_CSV import write_data_csv
 
-# specify the directory containing the .ply files
-input_dir = "F:/aligned-binary-meshes/Yichen Meshes"
+# Output formats: legacy ASCII .vtk (the default, as Deformetrica has always been given), or opt-in legacy binary
+# .vtk or zlib-compressed XML .vtp (smaller and faster to write, but they change the files Deformetrica reads)
+EXTENSIONS = {'ascii': '.vtk', 'binary': '.vtk', 'vtp': '.vtp'}
+STATE_FILE = '.ply_to_vtk_state.json'
 
-# create a list of all .ply files in the directory
-ply_files = [f for f in os.listdir(input_dir) if f.endswith('.ply')]
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
 
-# create a directory to save the vtk files
-output_dir = os.path.join(input_dir, "VTK Files")
-if not os.path.exists(output_dir):
-    os.mkdir(output_dir)
-
-# loop over each .ply file and convert it to .vtk format
-for ply_file in ply_files:
-    # create a reader for the ply file
-    reader = vtk.vtkPLYReader()
-    reader.SetFileName(os.path.join(input_dir, ply_file))
-    reader.Update()
-    # get the output of the reader (vtkPolyData object)
-    polydata = reader.GetOutput()
-    # create a writer for the vtk file
-    vtk_file = os.path.splitext(ply_file)[0] + '.vtk'  # replace .ply extension with .vtk
-    vtk_path = os.path.join(output_dir, vtk_file)
-    writer = vtk.vtkPolyDataWriter()
-    writer.SetFileName(vtk_path)
+# Write polydata in the requested format
+def write_polydata(polydata, output_path, file_format='ascii'):
+    # create a writer for the output file
+    if file_format == 'vtp':
+        writer = vtk.vtkXMLPolyDataWriter()
+        writer.SetDataModeToAppended()
+        writer.EncodeAppendedDataOff()
+        writer.SetCompressorTypeToZLib()
+    else:
+        writer = vtk.vtkPolyDataWriter()
+        if file_format == 'binary':
+            writer.SetFileTypeToBinary()
+    # write to a temporary name first so an interrupted run never leaves a partial file behind
+    temporary_path = output_path + '.tmp'
+    writer.SetFileName(temporary_path)
     writer.SetInputData(polydata)
     writer.Write()
-    print(f"Converted {ply_file} to {vtk_file}")
+    os.replace(temporary_path, output_path)
+
+# Read one .ply file and write it in the requested format
+def convert_ply(ply_path, output_path, file_format='ascii'):
+    name = os.path.basename(ply_path)
+    # create a reader for the ply file
+    with span('vtk.read', name, inputs=[ply_path]):
+        reader = vtk.vtkPLYReader()
+        reader.SetFileName(ply_path)
+        reader.Update()
+    with span('vtk.write', name, outputs=[output_path]):
+        write_polydata(reader.GetOutput(), output_path, file_format)
+
+# Record of the input a previous run converted: size, modification time, content hash and format
+def _source_record(ply_path, file_format, sha256=None):
+    stat = os.stat(ply_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256 or file_sha256(ply_path),
+            'format': file_format}
+
+def _convert_task(task):
+    ply_path, output_path, file_format, cache_dir, cache_budget_mb = task
+    start = time.perf_counter()
+    if cache_dir is None:
+        hit = False
+        convert_ply(ply_path, output_path, file_format)
+    else:
+        hit, _ = cached_call(cache_dir, 'ply_to_vtk', lambda source, target: convert_ply(source, target, file_format),
+                             ply_path, output_path, {'format': file_format}, cache_budget_mb)
+    return time.perf_counter() - start, _source_record(ply_path, file_format), hit
+
+# A file is already converted when its output exists and it is unchanged since the last run,
+# either by size and mtime or, when those differ (e.g. a copied file), by content hash
+def is_converted(ply_path, output_path, record, file_format):
+    if record is None or record.get('format') != file_format or not os.path.exists(output_path):
+        return False
+    stat = os.stat(ply_path)
+    if record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    return record['size'] == stat.st_size and record['sha256'] == file_sha256(ply_path)
+
+# Convert every .ply file in input_dir with n_workers processes (all cores by default), skipping files that are
+# already converted, and write the Deformetrica data_set.xml and data.csv for the converted files in the same pass.
+# With a cache_dir, outputs that were deleted or converted elsewhere from the same .ply are copied from the cache
+def batch_convert(input_dir, output_dir=None, file_format='ascii', n_workers=None, write_manifests=True,
+                  cache_dir=None, cache_budget_mb=CACHE_BUDGET_MB):
+    output_dir = output_dir or os.path.join(input_dir, "VTK Files")
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = os.path.join(output_dir, STATE_FILE)
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    # create a sorted list of all .ply files in the directory
+    ply_files = sorted(f for f in os.listdir(input_dir) if f.endswith('.ply'))
+    output_files = [os.path.splitext(ply_file)[0] + EXTENSIONS[file_format] for ply_file in ply_files]
+
+    tasks = []
+    for ply_file, output_file in zip(ply_files, output_files):
+        ply_path = os.path.join(input_dir, ply_file)
+        if is_converted(ply_path, os.path.join(output_dir, output_file), state.get(ply_file), file_format):
+            print(f"Skipping {ply_file} (already converted)")
+            state[ply_file] = _source_record(ply_path, file_format, state[ply_file]['sha256'])
+        else:
+            tasks.append((ply_file, output_file))
+
+    task_args = [(os.path.join(input_dir, ply_file), os.path.join(output_dir, output_file), file_format, cache_dir,
+                  cache_budget_mb) for ply_file, output_file in tasks]
+    if n_workers == 1 or len(task_args) < 2:
+        results = [_convert_task(task) for task in task_args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_convert_task, task_args))
+    for (ply_file, output_file), (seconds, record, hit) in zip(tasks, results):
+        state[ply_file] = record
+        print(f"{'Copied cached' if hit else 'Converted'} {ply_file} to {output_file} ({seconds:.2f} s)")
+    if cache_dir is not None:
+        summarise_hits('ply_to_vtk', [hit for _, _, hit in results])
+
+    # forget files that are no longer in the input directory
+    state = {ply_file: state[ply_file] for ply_file in ply_files}
+    with open(state_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+    if write_manifests:
+        write_data_set_xml(output_files, os.path.join(output_dir, 'data_set.xml'))
+        write_data_csv(output_files, os.path.join(output_dir, 'data.csv'))
+    report()
+    return output_files
+
+if __name__ == '__main__':
+    # specify the directory containing the .ply files
+    input_dir = "F:/aligned-binary-meshes/Yichen Meshes"
+
+    # convert into the "VTK Files" folder next to the .ply files
+    batch_convert(input_dir)
@@ -0,0 +1,162 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for rendering control points on the initial atlas template to PNG without a display (headless)
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk
+from Batch_Control_Point_Mapping import CONTROL_POINTS_FILE, MAPPED_POINTS_FILE, find_output_folders, find_template
+
+# Colours used in the interactive scripts
+MESH_COLOUR = (0.87, 0.79, 0.69)  # #DECAB0
+MAPPED_COLOUR = (1.0, 0.0, 0.0)  # red
+UNMAPPED_COLOUR = (0.0, 0.0, 1.0)  # blue
+
+# Fixed camera views: name -> (direction from the mesh centre to the camera, view up)
+VIEWS = {
+    "lateral": ((1.0, 0.0, 0.0), (0.0, 0.0, 1.0)),
+    "dorsal": ((0.0, 0.0, 1.0), (0.0, 1.0, 0.0)),
+    "anterior": ((0.0, 1.0, 0.0), (0.0, 0.0, 1.0)),
+}
+
+# One figure: template mesh, control points text file, output prefix (PNGs are saved as <prefix>_<view>.png)
+RenderJob = namedtuple("RenderJob", ["template", "control_points", "output_prefix", "colour"])
+RenderJob.__new__.__defaults__ = (MAPPED_COLOUR,)
+
+# Build a reusable scene: the mesh mapper and the single glyph pass get new inputs for every job
+def create_scene(size=(800, 600), sphere_radius=1.0):
+    sphere_source = vtk.vtkSphereSource()
+    sphere_source.SetRadius(sphere_radius)
+
+    points_polydata = vtk.vtkPolyData()
+    glyph = vtk.vtkGlyph3D()
+    glyph.SetInputData(points_polydata)
+    glyph.SetSourceConnection(sphere_source.GetOutputPort())
+
+    mapper_points = vtk.vtkPolyDataMapper()
+    mapper_points.SetInputConnection(glyph.GetOutputPort())
+    actor_points = vtk.vtkActor()
+    actor_points.SetMapper(mapper_points)
+
+    mapper_mesh = vtk.vtkPolyDataMapper()
+    actor_mesh = vtk.vtkActor()
+    actor_mesh.SetMapper(mapper_mesh)
+    actor_mesh.GetProperty().SetColor(*MESH_COLOUR)
+    actor_mesh.GetProperty().SetSpecular(0.5)
+    actor_mesh.GetProperty().SetSpecularPower(30)
+
+    renderer = vtk.vtkRenderer()
+    renderer.AddActor(actor_mesh)
+    renderer.AddActor(actor_points)
+    renderer.SetBackground(1.0, 1.0, 1.0)
+
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.SetSize(*size)
+    render_window.AddRenderer(renderer)
+
+    return {"render_window": render_window, "renderer": renderer, "glyph": glyph,
+            "mapper_mesh": mapper_mesh, "actor_points": actor_points}
+
+# Place the camera along a fixed direction so every figure of a template is framed the same way
+def set_view(renderer, bounds, direction, view_up):
+    center = [(bounds[0] + bounds[1]) / 2, (bounds[2] + bounds[3]) / 2, (bounds[4] + bounds[5]) / 2]
+    camera = renderer.GetActiveCamera()
+    camera.SetFocalPoint(center)
+    camera.SetPosition([c + d for c, d in zip(center, direction)])
+    camera.SetViewUp(view_up)
+    renderer.ResetCamera(bounds)
+
+# Save the current contents of a render window as a PNG
+def save_png(render_window, output_file):
+    window_to_image = vtk.vtkWindowToImageFilter()
+    window_to_image.SetInput(render_window)
+    window_to_image.ReadFrontBufferOff()
+    window_to_image.Update()
+    writer = vtk.vtkPNGWriter()
+    writer.SetFileName(output_file)
+    writer.SetInputConnection(window_to_image.GetOutputPort())
+    writer.Write()
+
+# Render every view of an already populated render window, returning the time taken per figure
+def save_views(render_window, renderer, output_prefix, views=VIEWS):
+    timings = []
+    bounds = renderer.ComputeVisiblePropBounds()
+    for view, (direction, view_up) in views.items():
+        start = time.perf_counter()
+        set_view(renderer, bounds, direction, view_up)
+        render_window.Render()
+        save_png(render_window, "{}_{}.png".format(output_prefix, view))
+        timings.append((output_prefix, view, time.perf_counter() - start))
+    return timings
+
+def render_job(scene, job, views=VIEWS):
+    start = time.perf_counter()
+    reader = vtk.vtkPolyDataReader()
+    reader.SetFileName(job.template)
+    reader.Update()
+    scene["mapper_mesh"].SetInputData(reader.GetOutput())
+
+    control_points = np.atleast_2d(np.loadtxt(job.control_points))[:, :3]
+    points = vtk.vtkPoints()
+    points.SetData(numpy_to_vtk(np.ascontiguousarray(control_points)))
+    points_polydata = vtk.vtkPolyData()
+    points_polydata.SetPoints(points)
+    scene["glyph"].SetInputData(points_polydata)
+    scene["actor_points"].GetProperty().SetColor(*job.colour)
+    load_time = time.perf_counter() - start
+
+    return load_time, save_views(scene["render_window"], scene["renderer"], job.output_prefix, views)
+
+# Render a list of jobs through one reusable offscreen render window
+def render_job_chunk(jobs, views=VIEWS, size=(800, 600)):
+    scene = create_scene(size)
+    timings = []
+    for job in jobs:
+        load_time, view_timings = render_job(scene, job, views)
+        timings.extend((prefix, view, load_time, seconds) for prefix, view, seconds in view_timings)
+    scene["render_window"].Finalize()
+    return timings
+
+# Split the jobs over n_workers render processes (all cores by default), one render window each
+def render_jobs(jobs, views=VIEWS, size=(800, 600), n_workers=None):
+    jobs = list(jobs)
+    n_workers = min(n_workers or os.cpu_count() or 1, len(jobs)) or 1
+    chunks = [jobs[i::n_workers] for i in range(n_workers)]
+    if n_workers == 1:
+        results = [render_job_chunk(jobs, views, size)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(render_job_chunk, chunks, [views] * n_workers, [size] * n_workers))
+    timings = [timing for chunk in results for timing in chunk]
+    for prefix, view, load_time, seconds in timings:
+        print(f"{prefix}_{view}.png: load {load_time:.3f} s, render {seconds:.3f} s")
+    return timings
+
+# Build one job per 'Kernel */output' folder of a results tree (mapped points need Batch_Control_Point_Mapping first)
+def jobs_from_results(results_dir, mapped=True):
+    jobs = []
+    for output_dir in find_output_folders(results_dir):
+        if mapped:
+            jobs.append(RenderJob(find_template(output_dir), os.path.join(output_dir, MAPPED_POINTS_FILE),
+                                  os.path.join(output_dir, "mapped_control_points"), MAPPED_COLOUR))
+        else:
+            jobs.append(RenderJob(find_template(output_dir), os.path.join(output_dir, CONTROL_POINTS_FILE),
+                                  os.path.join(output_dir, "unmapped_control_points"), UNMAPPED_COLOUR))
+    return jobs
+
+if __name__ == '__main__':
+    # Example usage
+    results_directory = "name/of/results/directory"  # e.g. the 'Final Poisson Analysis' folder
+
+    render_jobs(jobs_from_results(results_directory, mapped=True))
+    render_jobs(jobs_from_results(results_directory, mapped=False))
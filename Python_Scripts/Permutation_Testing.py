@@ -0,0 +1,181 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for testing whether the kPCA scores separate the diet/locomotion groups: cross-validated SVC accuracy
+# compared against accuracies with permuted group labels
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import re
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.svm import SVC
+from sklearn.model_selection import StratifiedKFold
+from Kernel_PCA_Engine import squared_distances, rbf_gram
+
+N_PERMUTATIONS = 1000
+N_SPLITS = 5
+GROUP_COLUMNS = ('Diet', 'Locomotion')
+# Permutations per task, and the early stopping rule: once at least MIN_PERMUTATIONS have run, stop when the
+# 99% confidence interval of the exceedance probability lies entirely above or below ALPHA
+BATCH_SIZE = 25
+MIN_PERMUTATIONS = 200
+ALPHA = 0.05
+Z_SETTLED = 2.576
+
+# PC scores and group labels from a kpca.csv (or Data_A4-A9), leaving out unlabelled specimens and groups
+# too small to appear in every fold
+def read_groups(kpca_csv, group_column, n_components=None, min_group_size=N_SPLITS):
+    df = pd.read_csv(kpca_csv)
+    df.columns = df.columns.str.strip()
+    pcs = [column for column in df.columns if re.fullmatch(r'PC\d+', column)]
+    if n_components is not None:
+        pcs = pcs[:n_components]
+    df = df[df[group_column].notna()]
+    labels = df[group_column].astype(str).str.strip()
+    counts = labels.value_counts()
+    keep = labels.isin(counts.index[counts >= min_group_size]).to_numpy()
+    dropped = sorted(counts.index[counts < min_group_size])
+    if dropped:
+        print(f"{group_column}: leaving out groups with fewer than {min_group_size} specimens: {', '.join(dropped)}")
+    return df.loc[keep, pcs].to_numpy(dtype=np.float64), labels[keep].to_numpy()
+
+# Kernel of the SVC computed once for all permutations (rbf with 'scale' gamma is SVC's default)
+def precompute_kernel(X, kernel='rbf', gamma='scale'):
+    if kernel == 'linear':
+        return X @ X.T
+    if gamma == 'scale':
+        gamma = 1.0 / (X.shape[1] * X.var())
+    return rbf_gram(squared_distances(X), gamma)
+
+# Stratified folds of the observed labels, with the train/train and test/train kernel blocks of each fold,
+# reused by every permutation
+def fold_kernels(K, y, n_splits=N_SPLITS, seed=0):
+    splits = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed).split(np.zeros(len(y)), y)
+    return [(train, test, K[np.ix_(train, train)], K[np.ix_(test, train)]) for train, test in splits]
+
+# Mean accuracy over the folds
+def cv_score(folds, y, C=1.0):
+    scores = []
+    for train, test, K_train, K_test in folds:
+        model = SVC(kernel='precomputed', C=C).fit(K_train, y[train])
+        scores.append(np.mean(model.predict(K_test) == y[test]))
+    return float(np.mean(scores))
+
+_worker = {}
+
+def _init_worker(folds, y, C):
+    _worker.update(folds=folds, y=y, C=C)
+
+# One batch of permutations from its own seed, so results do not depend on the number of workers
+def _permutation_batch(task):
+    seed, size = task
+    rng = np.random.default_rng(seed)
+    return [cv_score(_worker['folds'], rng.permutation(_worker['y']), _worker['C']) for _ in range(size)]
+
+# Wilson interval of the probability that a permuted score reaches the observed one
+def exceedance_interval(count, n, z=Z_SETTLED):
+    p = count / n
+    centre = (p + z ** 2 / (2 * n)) / (1 + z ** 2 / n)
+    half = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / (1 + z ** 2 / n)
+    return centre - half, centre + half
+
+def is_settled(count, n, alpha=ALPHA, min_permutations=MIN_PERMUTATIONS):
+    if n < min_permutations:
+        return False
+    lower, upper = exceedance_interval(count, n)
+    return upper < alpha or lower > alpha
+
+# Permutation test of the cross-validated SVC accuracy, with batches of permutations spread over n_workers
+# processes (all cores by default) and collected in order, stopping early once the p-value is settled
+def permutation_test(X, y, n_permutations=N_PERMUTATIONS, n_splits=N_SPLITS, kernel='rbf', C=1.0, seed=0,
+                     n_workers=None, early_stopping=True, batch_size=BATCH_SIZE, alpha=ALPHA):
+    start = time.perf_counter()
+    folds = fold_kernels(precompute_kernel(X, kernel), y, n_splits, seed)
+    score = cv_score(folds, y, C)
+
+    sizes = [min(batch_size, n_permutations - first) for first in range(0, n_permutations, batch_size)]
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+    permutation_scores = []
+    stopped_early = False
+
+    def collect(batch):
+        permutation_scores.extend(batch)
+        count = int(np.sum(np.array(permutation_scores) >= score))
+        return early_stopping and is_settled(count, len(permutation_scores), alpha)
+
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers == 1:
+        _init_worker(folds, y, C)
+        for task in tasks:
+            if collect(_permutation_batch(task)):
+                stopped_early = True
+                break
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(folds, y, C)) as executor:
+            pending = deque()
+            next_task = 0
+            while pending or next_task < len(tasks):
+                while next_task < len(tasks) and len(pending) < 2 * n_workers:
+                    pending.append(executor.submit(_permutation_batch, tasks[next_task]))
+                    next_task += 1
+                if collect(pending.popleft().result()):
+                    stopped_early = True
+                    for future in pending:
+                        future.cancel()
+                    break
+
+    permutation_scores = np.array(permutation_scores)
+    seconds = time.perf_counter() - start
+    return {'score': score,
+            'p_value': (np.sum(permutation_scores >= score) + 1) / (len(permutation_scores) + 1),
+            'n_permutations': len(permutation_scores),
+            'stopped_early': stopped_early,
+            'permutation_scores': permutation_scores,
+            'seconds': seconds,
+            'permutations_per_second': len(permutation_scores) / seconds}
+
+# Test every group column of a kpca.csv and tabulate the results
+def run_group_tests(kpca_csv, group_columns=GROUP_COLUMNS, output_csv=None, n_components=None, **options):
+    rows = []
+    for group_column in group_columns:
+        X, y = read_groups(kpca_csv, group_column, n_components, options.get('n_splits', N_SPLITS))
+        result = permutation_test(X, y, **options)
+        rows.append({'Group': group_column, 'Specimens': len(y), 'Groups': len(np.unique(y)),
+                     'Accuracy': result['score'], 'p-value': result['p_value'],
+                     'Permutations': result['n_permutations'], 'Stopped Early': result['stopped_early'],
+                     'Seconds': round(result['seconds'], 3),
+                     'Permutations/s': round(result['permutations_per_second'], 1)})
+        print(f"{group_column}: accuracy {result['score']:.3f}, p = {result['p_value']:.4f} "
+              f"({result['n_permutations']} permutations, {result['permutations_per_second']:.1f} permutations/s)")
+    table = pd.DataFrame(rows)
+    if output_csv is not None:
+        table.to_csv(output_csv, index=False)
+    return table
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Permutation test of diet/locomotion group separation on kPCA scores.')
+    parser.add_argument('kpca_csv', help='kpca.csv written by the landmark-free analysis (or Data_A4-A9)')
+    parser.add_argument('--groups', nargs='+', default=list(GROUP_COLUMNS))
+    parser.add_argument('--n-components', type=int, default=None, help='number of PCs used (default: all)')
+    parser.add_argument('--permutations', type=int, default=N_PERMUTATIONS)
+    parser.add_argument('--splits', type=int, default=N_SPLITS)
+    parser.add_argument('--kernel', choices=['rbf', 'linear'], default='rbf')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--no-early-stopping', action='store_true')
+    parser.add_argument('--output', default=None, help='results .csv')
+    args = parser.parse_args(argv)
+    run_group_tests(args.kpca_csv, args.groups, args.output, args.n_components, n_permutations=args.permutations,
+                    n_splits=args.splits, kernel=args.kernel, seed=args.seed, n_workers=args.workers,
+                    early_stopping=not args.no_early_stopping)
+
+if __name__ == '__main__':
+    main()
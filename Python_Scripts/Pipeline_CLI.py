@@ -0,0 +1,261 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for running the processing scripts from one command line: python Pipeline_CLI.py <command> ...
+# Commands: convert, decimate, voxelise, centroid, manifest, map-controlpoints, render, kpca (and startup, which
+# times the cold start). Each command imports its script only when it runs, so --help and small jobs start fast.
+# Paths and options can also come from a .json config file: top-level keys apply to every command and a section
+# named after a command applies to that command, e.g. {"workers": 8, "decimate": {"input_dir": "...", "face_count": 50000}}.
+# Keys are option names (workers, face_count or face-count) or positional names; unknown keys are an error
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries (standard library only; everything else is imported by the command that needs it)
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+COMMANDS = ('convert', 'decimate', 'voxelise', 'centroid', 'manifest', 'map-controlpoints', 'render', 'kpca')
+# Extra time over a bare interpreter allowed for `--help` and the help of every command
+STARTUP_BUDGET_MS = 100
+
+# Keyword arguments for the options that were given, so the scripts' own defaults apply to the rest
+def _given(args, *names):
+    return {name: getattr(args, name) for name in names if getattr(args, name) is not None}
+
+def run_convert(args):
+    if args.format == 'ply-ascii':
+        from Batch_Mesh_to_ASCII import batch_convert_to_ascii
+        batch_convert_to_ascii(args.input_dir, args.output_dir, **_given(args, 'n_workers', 'cache_dir'))
+    else:
+        from New_Folder_Batch_Ply_to_VTK_Convert import batch_convert
+        batch_convert(args.input_dir, args.output_dir, args.format, write_manifests=not args.no_manifests,
+                      **_given(args, 'n_workers', 'cache_dir'))
+
+def run_decimate(args):
+    from Mesh_Decimation_Smoothing import batch_process
+    batch_process(args.input_dir, args.output_dir, force=args.force,
+                  **_given(args, 'n_workers', 'smoothing', 'stats_file', 'face_count', 'cache_dir'))
+
+def run_voxelise(args):
+    from Variable_Batch_Mesh_to_Label_File_Convertor_final import batch_voxelise
+    batch_voxelise(args.input_dir, args.output_dir,
+                   **_given(args, 'mode', 'n_workers', 'memory_budget_mb', 'pitch_divisor', 'cache_dir'))
+
+def run_centroid(args):
+    from Specimen_Catalog import centroid_report
+    output_csv = args.output or os.path.join(args.directory, 'Mesh_centroid_sizes.csv')
+    centroid_report(args.directory, output_csv, args.format)
+    print(f"Centroid sizes saved to {output_csv}")
+
+def run_manifest(args):
+    from Specimen_Catalog import specimen_filenames
+    from Mammal_Dataset_XML_Generation import write_data_set_xml
+    from Write_Data_CSV import write_data_csv
+    filenames = specimen_filenames(args.directory, args.format)
+    data_set = args.data_set or os.path.join(args.directory, 'data_set.xml')
+    data_csv = args.data_csv or os.path.join(args.directory, 'data.csv')
+    write_data_set_xml(filenames, data_set)
+    write_data_csv(filenames, data_csv)
+    print(f"{len(filenames)} subjects written to {data_set} and {data_csv}")
+
+def run_map_controlpoints(args):
+    from Batch_Control_Point_Mapping import batch_map_control_points
+    batch_map_control_points(args.results_dir, args.n_workers)
+
+def run_render(args):
+    from Offscreen_Control_Point_Rendering import render_jobs, jobs_from_results
+    for mapped in {'mapped': (True,), 'unmapped': (False,), 'both': (True, False)}[args.points]:
+        render_jobs(jobs_from_results(args.results_dir, mapped=mapped), size=tuple(args.size),
+                    n_workers=args.n_workers)
+
+def run_kpca(args):
+    if args.sweep:
+        from Landmark_Free_Sweep import run_sweep
+        run_sweep(args.directory, force=args.force, **_given(args, 'gamma', 'n_components', 'n_workers'))
+    else:
+        from Landmark_Free_Sweep import run_analysis
+        _, eig = run_analysis(args.directory, save_model=args.save_model, **_given(args, 'gamma', 'n_components'))
+        print(eig[['PCA dimension', 'cum. variability (in %)', 'lambda']].head(10).to_string(index=False))
+        print('kpca.csv and eigenvalues.csv written to {}'.format(args.directory))
+
+# Cold start: the best of several fresh-process runs of `--help` (and every command's help), less a bare interpreter
+def measure_startup(repeats=5, commands=COMMANDS):
+    def best(command):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+        return 1000 * min(times)
+    baseline = best([sys.executable, '-c', 'pass'])
+    script = os.path.abspath(__file__)
+    timings = {'--help': best([sys.executable, script, '--help']) - baseline}
+    for command in commands:
+        timings[command + ' --help'] = best([sys.executable, script, command, '--help']) - baseline
+    return baseline, timings
+
+def run_startup(args):
+    baseline, timings = measure_startup(args.repeats)
+    print(f"Bare interpreter: {baseline:.1f} ms")
+    over = []
+    for name, overhead in timings.items():
+        print(f"{name:<28}{overhead:>8.1f} ms over the interpreter")
+        if overhead > args.budget_ms:
+            over.append(name)
+    if over:
+        print(f"Over the {args.budget_ms} ms budget: {', '.join(over)}")
+        return 1
+    print(f"All within the {args.budget_ms} ms budget")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Landmark-free morphometrics pipeline.')
+    parser.add_argument('--config', default=None, help='.json file of paths and options')
+    parser.add_argument('--trace', default=None, metavar='DIR', help='record timing spans to this folder (Pipeline_Instrumentation)')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    required = {}
+
+    def add(name, handler, help_text, positionals):
+        sub = commands.add_parser(name, help=help_text, description=help_text)
+        for positional, positional_help in positionals:
+            sub.add_argument(positional, nargs='?', default=None, help=positional_help + ' (or in the config file)')
+        sub.set_defaults(handler=handler)
+        required[name] = [positional for positional, _ in positionals]
+        return sub
+
+    def add_workers(sub):
+        sub.add_argument('--workers', dest='n_workers', type=int, default=None, help='number of processes (default: all cores)')
+
+    sub = add('convert', run_convert, 'Convert .ply meshes to .vtk/.vtp (and write data_set.xml/data.csv), or to ASCII .ply',
+              [('input_dir', 'folder of .ply files')])
+    sub.add_argument('output_dir', nargs='?', default=None, help="output folder (default for .vtk: '<input_dir>/VTK Files')")
+    sub.add_argument('--format', choices=['ascii', 'binary', 'vtp', 'ply-ascii'], default='ascii',
+                     help='legacy ASCII .vtk (default, as Deformetrica has been given), binary .vtk, .vtp, or ASCII .ply')
+    sub.add_argument('--no-manifests', action='store_true', help='do not write data_set.xml and data.csv')
+    sub.add_argument('--cache-dir', default=None)
+    add_workers(sub)
+
+    sub = add('decimate', run_decimate, 'Smooth and decimate .ply meshes',
+              [('input_dir', 'folder of .ply files'), ('output_dir', 'output folder')])
+    sub.add_argument('--smoothing', choices=['trimesh', 'sparse'], default=None)
+    sub.add_argument('--face-count', type=int, default=None)
+    sub.add_argument('--stats-file', default=None)
+    sub.add_argument('--force', action='store_true')
+    sub.add_argument('--cache-dir', default=None)
+    add_workers(sub)
+
+    sub = add('voxelise', run_voxelise, 'Voxelise meshes into .tif label files',
+              [('input_dir', 'folder of meshes'), ('output_dir', 'output folder')])
+    sub.add_argument('--mode', choices=['slab', 'dense'], default=None)
+    sub.add_argument('--pitch-divisor', type=float, default=None)
+    sub.add_argument('--memory-budget-mb', type=float, default=None)
+    sub.add_argument('--cache-dir', default=None)
+    add_workers(sub)
+
+    sub = add('centroid', run_centroid, 'Centroid sizes of the meshes in a folder', [('directory', 'folder of meshes')])
+    sub.add_argument('--output', default=None, help="centroid .csv (default: '<directory>/Mesh_centroid_sizes.csv')")
+    sub.add_argument('--format', default='vtk')
+
+    sub = add('manifest', run_manifest, 'Write the Deformetrica data_set.xml and data.csv for a folder of meshes',
+              [('directory', 'folder of meshes')])
+    sub.add_argument('--format', default='vtk')
+    sub.add_argument('--data-set', default=None, help="default: '<directory>/data_set.xml'")
+    sub.add_argument('--data-csv', default=None, help="default: '<directory>/data.csv'")
+
+    sub = add('map-controlpoints', run_map_controlpoints, 'Map control points onto the template for every kernel width',
+              [('results_dir', 'results tree with Kernel */output folders')])
+    add_workers(sub)
+
+    sub = add('render', run_render, 'Render control points on the template to PNG (offscreen)',
+              [('results_dir', 'results tree with Kernel */output folders')])
+    sub.add_argument('--points', choices=['mapped', 'unmapped', 'both'], default='both')
+    sub.add_argument('--size', nargs=2, type=int, default=[800, 600], metavar=('WIDTH', 'HEIGHT'))
+    add_workers(sub)
+
+    sub = add('kpca', run_kpca, 'Kernel PCA of the momenta (kpca.csv and eigenvalues.csv)',
+              [('directory', 'Deformetrica output folder, or a results tree with --sweep')])
+    sub.add_argument('--sweep', action='store_true', help='run every output folder in the tree that changed')
+    sub.add_argument('--gamma', type=float, default=None)
+    sub.add_argument('--n-components', type=int, default=None)
+    sub.add_argument('--save-model', action='store_true')
+    sub.add_argument('--force', action='store_true')
+    add_workers(sub)
+
+    sub = commands.add_parser('startup', help='Time the cold start of the command line against its budget')
+    sub.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS)
+    sub.add_argument('--repeats', type=int, default=5)
+    sub.set_defaults(handler=run_startup)
+    required['startup'] = []
+    return parser, commands, required
+
+# Config keys a parser accepts: every option string without its dashes (and the dest) -> dest
+def _config_keys(parser, exclude=('help',)):
+    keys = {}
+    for action in parser._actions:
+        if action.dest in exclude:
+            continue
+        for name in [action.dest] + [option.lstrip('-') for option in action.option_strings]:
+            keys[name.replace('-', '_')] = action.dest
+    return keys
+
+# Use the config file values as defaults of the matching options (command line arguments still win); a top-level
+# key sets every command (or global option) that has it, a section sets one command
+def apply_config(parser, commands, config):
+    command_keys = {name: _config_keys(sub) for name, sub in commands.choices.items()}
+    global_keys = _config_keys(parser, exclude=('help', 'config', 'command'))
+    unknown = []
+    for key, value in config.items():
+        if isinstance(value, dict):
+            continue
+        key = key.replace('-', '_')
+        matched = False
+        if key in global_keys:
+            parser.set_defaults(**{global_keys[key]: value})
+            matched = True
+        for name, keys in command_keys.items():
+            if key in keys:
+                commands.choices[name].set_defaults(**{keys[key]: value})
+                matched = True
+        if not matched:
+            unknown.append(key)
+    for name, section in config.items():
+        if not isinstance(section, dict):
+            continue
+        if name not in commands.choices:
+            unknown.append(name)
+            continue
+        for key, value in section.items():
+            dest = command_keys[name].get(key.replace('-', '_'))
+            if dest is None:
+                unknown.append('{}.{}'.format(name, key))
+            else:
+                commands.choices[name].set_defaults(**{dest: value})
+    if unknown:
+        parser.error('unknown config keys: {}'.format(', '.join(unknown)))
+
+def main(argv=None):
+    parser, commands, required = build_parser()
+    known, _ = parser.parse_known_args(argv)
+    if known.config:
+        with open(known.config) as f:
+            apply_config(parser, commands, json.load(f))
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    missing = [name for name in required[args.command] if getattr(args, name) is None]
+    if missing:
+        commands.choices[args.command].error('missing {} (give it as an argument or in the config file)'.format(
+            ', '.join(missing)))
+    if args.trace:
+        from Pipeline_Instrumentation import enable
+        enable(args.trace)
+    return args.handler(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for instrumenting the processing scripts: timing spans with per-specimen peak memory and bytes read/written,
+# an optional cProfile dump for one specimen, and a summary table plus .json trace at the end of a run.
+# Tracing is off unless enable() is called (or PIPELINE_TRACE_DIR is set); a disabled span costs one attribute check.
+# Spans are tagged with a run id, so a trace folder reused across runs reports each run on its own.
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import cProfile
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Settings are held in environment variables so worker processes started by the batch scripts inherit them
+TRACE_ENV = 'PIPELINE_TRACE_DIR'
+PROFILE_ENV = 'PIPELINE_PROFILE_SPECIMEN'
+RUN_ENV = 'PIPELINE_TRACE_RUN'
+TRACE_FILE = 'trace.json'
+
+_NULL_SPAN = nullcontext()
+_local = threading.local()
+_settings = {'trace_dir': os.environ.get(TRACE_ENV), 'profile_specimen': os.environ.get(PROFILE_ENV),
+             'run_id': os.environ.get(RUN_ENV)}
+
+# Start a new run: spans recorded from now on (in this process and the workers it starts) carry its id
+def new_run():
+    _settings['run_id'] = os.environ[RUN_ENV] = '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), uuid.uuid4().hex[:8])
+    return _settings['run_id']
+
+def enable(trace_dir, profile_specimen=None):
+    os.makedirs(trace_dir, exist_ok=True)
+    _settings['trace_dir'] = os.environ[TRACE_ENV] = os.path.abspath(trace_dir)
+    if profile_specimen is not None:
+        _settings['profile_specimen'] = os.environ[PROFILE_ENV] = profile_specimen
+    new_run()
+    return _settings['trace_dir']
+
+def disable():
+    os.environ.pop(TRACE_ENV, None)
+    os.environ.pop(PROFILE_ENV, None)
+    os.environ.pop(RUN_ENV, None)
+    _settings['trace_dir'] = _settings['profile_specimen'] = _settings['run_id'] = None
+
+# Tracing switched on through the environment alone: this process starts the run its workers will join
+if _settings['trace_dir'] is not None and _settings['run_id'] is None:
+    os.makedirs(_settings['trace_dir'], exist_ok=True)
+    new_run()
+
+# Peak resident memory of this process in MB
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 ** 2
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+# Memory available to new processes on this machine in MB
+def available_memory_mb():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().available / 1024 ** 2
+    except ImportError:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+# On Linux the peak can be reset, so each specimen gets its own peak rather than the peak of the whole process
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_memory_mb()
+
+# Bytes read and written by this process so far (all reads/writes, including those served from the page cache)
+def io_counters():
+    try:
+        with open('/proc/self/io') as f:
+            values = dict(line.split(':') for line in f)
+        return int(values['rchar']), int(values['wchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import psutil
+        counters = psutil.Process().io_counters()
+        return counters.read_bytes, counters.write_bytes
+    except (ImportError, AttributeError):
+        return None
+
+def _file_bytes(paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+# Time a block of work. inputs/outputs are the files it reads/writes (their sizes are recorded); the specimen
+# defaults to that of the enclosing span. The outermost span resets the peak memory so nested spans report the
+# peak reached since the specimen started.
+def span(stage, specimen=None, inputs=(), outputs=()):
+    trace_dir = _settings['trace_dir']
+    if trace_dir is None:
+        return _NULL_SPAN
+    return _span(trace_dir, stage, specimen, inputs, outputs)
+
+@contextmanager
+def _span(trace_dir, stage, specimen, inputs, outputs):
+    stack = _stack()
+    if specimen is None and stack:
+        specimen = stack[-1]
+    if not stack:
+        reset_peak_rss()
+    profiler = None
+    if not stack and specimen is not None and specimen == _settings['profile_specimen']:
+        profiler = cProfile.Profile()
+    stack.append(specimen)
+    io_start = io_counters()
+    wall_start = time.time()
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        seconds = time.perf_counter() - start
+        stack.pop()
+        io_end = io_counters()
+        record = {'run': _settings['run_id'], 'stage': stage, 'specimen': specimen, 'start': wall_start,
+                  'seconds': seconds,
+                  'peak_rss_mb': round(peak_rss_mb(), 1), 'depth': len(stack),
+                  'file_bytes_read': _file_bytes(inputs), 'file_bytes_written': _file_bytes(outputs),
+                  'io_bytes_read': io_end[0] - io_start[0] if io_start else None,
+                  'io_bytes_written': io_end[1] - io_start[1] if io_start else None,
+                  'pid': os.getpid(), 'thread': threading.get_ident()}
+        if profiler is not None:
+            record['profile'] = os.path.join(trace_dir, '{}_{}.prof'.format(stage, specimen))
+            profiler.dump_stats(record['profile'])
+        # One file per process, appended as spans finish, so nothing is lost if a worker dies
+        with open(os.path.join(trace_dir, 'spans-{}.jsonl'.format(os.getpid())), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+# Spans in a trace folder, only those of one run if run_id is given
+def load_spans(trace_dir, run_id=None):
+    records = []
+    for spans_file in sorted(glob.glob(os.path.join(trace_dir, 'spans-*.jsonl'))):
+        with open(spans_file) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    if run_id is not None:
+        records = [record for record in records if record.get('run') == run_id]
+    return sorted(records, key=lambda record: record['start'])
+
+# Id of the run that recorded the latest span in a trace folder
+def latest_run(trace_dir):
+    records = load_spans(trace_dir)
+    return records[-1].get('run') if records else None
+
+# Per-stage totals: count, total/mean/max seconds, largest peak memory and total bytes read/written
+def summarise(records):
+    summary = {}
+    for record in records:
+        row = summary.setdefault(record['stage'], {'stage': record['stage'], 'count': 0, 'total_seconds': 0.0,
+                                                   'max_seconds': 0.0, 'peak_rss_mb': 0.0, 'bytes_read': 0,
+                                                   'bytes_written': 0})
+        row['count'] += 1
+        row['total_seconds'] += record['seconds']
+        row['max_seconds'] = max(row['max_seconds'], record['seconds'])
+        row['peak_rss_mb'] = max(row['peak_rss_mb'], record['peak_rss_mb'])
+        row['bytes_read'] += record['file_bytes_read'] or record['io_bytes_read'] or 0
+        row['bytes_written'] += record['file_bytes_written'] or record['io_bytes_written'] or 0
+    for row in summary.values():
+        row['mean_seconds'] = row['total_seconds'] / row['count']
+    return sorted(summary.values(), key=lambda row: -row['total_seconds'])
+
+def print_summary(rows):
+    print(f"{'stage':<28}{'count':>7}{'total s':>11}{'mean s':>10}{'max s':>10}{'peak MB':>10}{'read MB':>10}{'written MB':>12}")
+    for row in rows:
+        print(f"{row['stage']:<28}{row['count']:>7}{row['total_seconds']:>11.3f}{row['mean_seconds']:>10.3f}"
+              f"{row['max_seconds']:>10.3f}{row['peak_rss_mb']:>10.1f}{row['bytes_read'] / 1024 ** 2:>10.1f}"
+              f"{row['bytes_written'] / 1024 ** 2:>12.1f}")
+
+# Trace Event Format (complete events), viewable in chrome://tracing or Perfetto
+def write_trace(records, output_file):
+    events = [{'name': record['stage'], 'cat': record['specimen'] or '', 'ph': 'X',
+               'ts': record['start'] * 1e6, 'dur': record['seconds'] * 1e6, 'pid': record['pid'],
+               'tid': record['thread'], 'args': {key: value for key, value in record.items()
+                                                 if key not in ('stage', 'start', 'seconds', 'pid', 'thread')}}
+              for record in records]
+    with open(output_file, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+# End of a run: print the summary table and write the merged trace of the current run (or, for a given
+# trace folder, of run_id or the latest run in it). Spans recorded after reporting the current run start a new run.
+def report(trace_dir=None, run_id=None):
+    current = trace_dir is None
+    trace_dir = trace_dir or _settings['trace_dir']
+    if trace_dir is None:
+        return []
+    if run_id is None:
+        run_id = _settings['run_id'] if current else latest_run(trace_dir)
+    records = load_spans(trace_dir, run_id)
+    if current:
+        new_run()
+    rows = summarise(records)
+    print_summary(rows)
+    write_trace(records, os.path.join(trace_dir, TRACE_FILE))
+    with open(os.path.join(trace_dir, 'summary.json'), 'w') as f:
+        json.dump(rows, f, indent=2)
+    print(f"Trace of {len(records)} spans (run {run_id}) written to {os.path.join(trace_dir, TRACE_FILE)}")
+    return rows
+
+if __name__ == '__main__':
+    # Summarise the latest run (or a given run) in a trace folder: python Pipeline_Instrumentation.py <trace folder> [run id]
+    report(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
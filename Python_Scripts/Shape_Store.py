@@ -0,0 +1,245 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for a memory-mapped shape store: the Deformetrica reconstructions (which all share the template topology)
+# held as one faces array plus a float32 [subjects, vertices, 3] coordinate array, with the momenta and control
+# points alongside, so the centroid size, displacement and kPCA steps read slices instead of re-parsing files
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import re
+import glob
+import json
+import time
+import argparse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+from Pipeline_Instrumentation import span
+from Batch_Mesh_Centroid_Measurement_v1 import centroid_size, save_to_csv
+from Batch_Control_Point_Mapping import find_template, MAPPED_POINTS_FILE
+from Deformetrica_Parameter_Loader import parse_momenta, parse_control_points, MOMENTA_FILE, CONTROL_POINTS_FILE
+
+INDEX_FILE = 'store.json'
+FACES_FILE = 'faces.npy'
+COORDINATES_FILE = 'coordinates.npy'
+TEMPLATE_FILE = 'template.npy'
+# Arrays imported from the Deformetrica output folder, saved under these names
+PARAMETER_FILES = {'momenta': 'momenta.npy', 'control_points': 'control_points.npy',
+                   'mapped_points': 'mapped_points.npy'}
+RECONSTRUCTION_PATTERN = 'DeterministicAtlas__Reconstruction__*__subject_*.vtk'
+DATA_SET_FILE = 'data_set.xml'
+
+# Points and triangles of a .vtk file
+def read_vtk_mesh(vtk_file):
+    reader = vtk.vtkPolyDataReader()
+    reader.SetFileName(vtk_file)
+    reader.Update()
+    polydata = reader.GetOutput()
+    points = vtk_to_numpy(polydata.GetPoints().GetData())
+    polys = polydata.GetPolys()
+    faces = vtk_to_numpy(polys.GetConnectivityArray()).reshape(-1, 3) if polys.GetNumberOfCells() else None
+    return points, faces
+
+# Create an empty store for n_subjects shapes of the given topology; the coordinates are allocated on disk
+# (one contiguous [vertices, 3] chunk per subject) and filled in by the importers
+def create_store(store_dir, faces, n_vertices, names, template=None, filenames=None):
+    os.makedirs(store_dir, exist_ok=True)
+    np.save(os.path.join(store_dir, FACES_FILE), np.asarray(faces, dtype=np.int64))
+    coordinates = np.lib.format.open_memmap(os.path.join(store_dir, COORDINATES_FILE), mode='w+',
+                                            dtype=np.float32, shape=(len(names), n_vertices, 3))
+    del coordinates
+    if template is not None:
+        np.save(os.path.join(store_dir, TEMPLATE_FILE), np.asarray(template, dtype=np.float32))
+    _write_index(store_dir, {'subjects': list(names), 'filenames': list(filenames or names),
+                             'sources': [None] * len(names), 'created': time.time()})
+
+def _read_index(store_dir):
+    with open(os.path.join(store_dir, INDEX_FILE)) as f:
+        return json.load(f)
+
+def _write_index(store_dir, index):
+    temporary = os.path.join(store_dir, INDEX_FILE + '.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(temporary, os.path.join(store_dir, INDEX_FILE))
+
+# Open a store: the arrays are memory-mapped, so slicing a subject reads only that subject from disk
+def open_store(store_dir, mode='r'):
+    index = _read_index(store_dir)
+    store = {'dir': store_dir,
+             'subjects': index['subjects'],
+             'filenames': index.get('filenames', index['subjects']),
+             'sources': index.get('sources'),
+             'faces': np.load(os.path.join(store_dir, FACES_FILE), mmap_mode='r'),
+             'coordinates': np.load(os.path.join(store_dir, COORDINATES_FILE), mmap_mode=mode)}
+    template_path = os.path.join(store_dir, TEMPLATE_FILE)
+    store['template'] = np.load(template_path, mmap_mode='r') if os.path.exists(template_path) else None
+    for key, file_name in PARAMETER_FILES.items():
+        path = os.path.join(store_dir, file_name)
+        store[key] = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+    return store
+
+def subject_index(store, name):
+    return store['subjects'].index(name)
+
+# Coordinates of one subject, as a view of the memory-mapped array
+def subject_points(store, name):
+    return store['coordinates'][subject_index(store, name)]
+
+# Read one mesh and write its points straight into its row of the store (each worker writes its own rows); the
+# mesh must have the store's point count and exactly its faces
+def _import_mesh(task):
+    store_dir, row, vtk_file = task
+    with span('store.import', os.path.basename(vtk_file), inputs=[vtk_file]):
+        points, faces = read_vtk_mesh(vtk_file)
+        coordinates = np.load(os.path.join(store_dir, COORDINATES_FILE), mmap_mode='r+')
+        store_faces = np.load(os.path.join(store_dir, FACES_FILE), mmap_mode='r')
+        if points.shape != coordinates.shape[1:] or not np.array_equal(
+                faces if faces is not None else np.empty((0, 3), dtype=np.int64), store_faces):
+            raise ValueError("{} does not share the store topology ({} points, expected {}; faces must match)".format(
+                vtk_file, len(points), coordinates.shape[1]))
+        coordinates[row] = points
+        coordinates.flush()
+    return row
+
+# Import meshes that share one topology (the first file gives the faces), n_workers at a time; filenames are the
+# original mesh files of the subjects (as in data_set.xml), kept to match tables keyed by them
+def import_vtk_meshes(store_dir, vtk_files, names=None, template=None, n_workers=None, filenames=None):
+    vtk_files = list(vtk_files)
+    if not vtk_files:
+        raise ValueError("No meshes to import")
+    names = names or [os.path.splitext(os.path.basename(path))[0] for path in vtk_files]
+    points, faces = read_vtk_mesh(vtk_files[0])
+    create_store(store_dir, faces if faces is not None else np.empty((0, 3), dtype=np.int64), len(points), names,
+                 template, filenames)
+    tasks = [(store_dir, row, path) for row, path in enumerate(vtk_files)]
+    if n_workers == 1 or len(tasks) < 2:
+        for task in tasks:
+            _import_mesh(task)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            list(executor.map(_import_mesh, tasks))
+    index = _read_index(store_dir)
+    index['sources'] = [os.path.abspath(path) for path in vtk_files]
+    _write_index(store_dir, index)
+    return open_store(store_dir)
+
+# The data_set.xml of a run: in the output folder, next to it, or in the Inputs folder next to it
+def find_data_set(output_dir):
+    candidates = [os.path.join(output_dir, DATA_SET_FILE), os.path.join(os.path.dirname(output_dir), DATA_SET_FILE),
+                  os.path.join(os.path.dirname(output_dir), 'Inputs', DATA_SET_FILE)]
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+# Subject ids and mesh filenames of a data_set.xml, in its order (the order of the momenta)
+def read_data_set_subjects(data_set_xml):
+    subjects = ET.parse(data_set_xml).getroot().findall('subject')
+    return [subject.get('id') for subject in subjects], [subject.find('.//filename').text for subject in subjects]
+
+# Subject id of a reconstruction: Deformetrica writes <name>__Reconstruction__<object>__subject_<id><extension>
+def reconstruction_subject(path):
+    match = re.search(r'__subject_(.+)$', os.path.basename(path))
+    if match is None:
+        raise ValueError("{} is not a Deformetrica reconstruction".format(path))
+    return os.path.splitext(match.group(1))[0]
+
+# Deformetrica reconstructions of an output folder in subject order: the order of data_set.xml when it is found
+# (or subject_ids are given), otherwise sorted by subject id as Mammal_Dataset_XML_Generation sorts the files
+def find_reconstructions(output_dir, subject_ids=None):
+    files = {reconstruction_subject(path): path for path in glob.glob(os.path.join(output_dir, RECONSTRUCTION_PATTERN))}
+    if subject_ids is None:
+        data_set = find_data_set(output_dir)
+        subject_ids = read_data_set_subjects(data_set)[0] if data_set else sorted(files)
+    missing = [subject for subject in subject_ids if subject not in files]
+    if missing:
+        raise FileNotFoundError("No reconstruction in {} for {}".format(output_dir, ', '.join(missing[:5])))
+    return [files[subject] for subject in subject_ids]
+
+# Save the momenta, control points and mapped control points of an output folder in the store
+def import_parameters(output_dir, store_dir):
+    sources = {'momenta': (MOMENTA_FILE, parse_momenta),
+               'control_points': (CONTROL_POINTS_FILE, parse_control_points),
+               'mapped_points': (MAPPED_POINTS_FILE, np.loadtxt)}
+    for key, (file_name, parse) in sources.items():
+        path = os.path.join(output_dir, file_name)
+        if os.path.exists(path):
+            with span('store.import', file_name, inputs=[path]):
+                np.save(os.path.join(store_dir, PARAMETER_FILES[key]), parse(path))
+
+# Build the store of one Deformetrica output folder: reconstructions, template and parameters. The subjects are
+# named by their data_set.xml subject ids and keep their mesh filenames, in the order of the momenta rows
+def import_output_folder(output_dir, store_dir, names=None, n_workers=None):
+    template, _ = read_vtk_mesh(find_template(output_dir))
+    data_set = find_data_set(output_dir)
+    if data_set is not None:
+        subject_ids, filenames = read_data_set_subjects(data_set)
+    else:
+        subject_ids = sorted(reconstruction_subject(path)
+                             for path in glob.glob(os.path.join(output_dir, RECONSTRUCTION_PATTERN)))
+        filenames = subject_ids
+    reconstructions = find_reconstructions(output_dir, subject_ids)
+    import_vtk_meshes(store_dir, reconstructions, names or subject_ids, template, n_workers, filenames)
+    import_parameters(output_dir, store_dir)
+    return open_store(store_dir)
+
+# Centroid size of every subject, computed from its slice of the store and keyed by its original mesh file (the
+# "Mesh File" column of the centroid measurement script, which Generalized_Procrustes.py --centroid-csv matches)
+def store_centroid_sizes(store, output_csv=None):
+    results = [(mesh_file, centroid_size(store['coordinates'][row])) for row, mesh_file in enumerate(store['filenames'])]
+    if output_csv is not None:
+        save_to_csv(results, output_csv)
+    return results
+
+# Per-vertex displacement of every subject from the template (or another reference), [subjects, vertices] float32,
+# one subject at a time
+def store_displacements(store, reference=None):
+    reference = np.asarray(store['template'] if reference is None else reference, dtype=np.float32)
+    coordinates = store['coordinates']
+    displacements = np.empty(coordinates.shape[:2], dtype=np.float32)
+    for row in range(len(coordinates)):
+        displacements[row] = np.linalg.norm(coordinates[row] - reference, axis=1)
+    return displacements
+
+# Displacement heatmaps (one point-data array per subject) on the template, as Deformation_Heatmap_Engine writes
+def write_displacement_heatmaps(store, output_path):
+    import trimesh
+    from Mesh_Stream_Pipeline import trimesh_to_polydata
+    from Deformation_Heatmap_Engine import write_heatmaps
+    template = trimesh.Trimesh(vertices=np.asarray(store['template'], dtype=np.float64),
+                               faces=np.asarray(store['faces']), process=False)
+    return write_heatmaps(trimesh_to_polydata(template), store_displacements(store), store['subjects'], output_path,
+                          mean_name='mean_displacement')
+
+# Momenta as the [subjects, dimension*controlpoints] matrix used for the kPCA (a view of the stored array)
+def store_momenta(store):
+    if store['momenta'] is None:
+        raise ValueError("No momenta in the store {}".format(store['dir']))
+    return store['momenta'].reshape(store['momenta'].shape[0], -1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build a memory-mapped shape store from a Deformetrica output folder.')
+    parser.add_argument('output_dir', help='Deformetrica output folder with the reconstructions and parameters')
+    parser.add_argument('store_dir', help='folder for the store')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--centroid-csv', default=None, help='also write the centroid sizes of the reconstructions')
+    parser.add_argument('--heatmaps', default=None, help='also write the displacement heatmaps to this .vtk file')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    store = import_output_folder(args.output_dir, args.store_dir, n_workers=args.workers)
+    print(f"Stored {len(store['subjects'])} subjects x {store['coordinates'].shape[1]} vertices in "
+          f"{args.store_dir} ({time.perf_counter() - start:.2f} s)")
+    if args.centroid_csv:
+        store_centroid_sizes(store, args.centroid_csv)
+    if args.heatmaps:
+        write_displacement_heatmaps(store, args.heatmaps)
+
+if __name__ == '__main__':
+    main()
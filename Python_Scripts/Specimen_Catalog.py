@@ -0,0 +1,156 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for keeping an on-disk (SQLite) catalog of the specimen meshes shared by the batch scripts
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import time
+import sqlite3
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+from Batch_Mesh_Centroid_Measurement_v1 import centroid, centroid_size, save_to_csv
+
+CATALOG_FILE = 'specimen_catalog.sqlite'
+MESH_EXTENSIONS = ('.ply', '.vtk', '.vtp', '.stl')
+
+COLUMNS = ['path', 'directory', 'name', 'format', 'size', 'mtime_ns', 'sha256', 'n_vertices', 'n_faces',
+           'xmin', 'xmax', 'ymin', 'ymax', 'zmin', 'zmax', 'cx', 'cy', 'cz', 'centroid_size', 'scanned_at']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS specimens (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    format TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    n_vertices INTEGER,
+    n_faces INTEGER,
+    xmin REAL, xmax REAL, ymin REAL, ymax REAL, zmin REAL, zmax REAL,
+    cx REAL, cy REAL, cz REAL,
+    centroid_size REAL,
+    scanned_at REAL
+);
+CREATE INDEX IF NOT EXISTS specimens_directory ON specimens (directory, format, name);
+"""
+
+READERS = {'.ply': vtk.vtkPLYReader, '.vtk': vtk.vtkPolyDataReader, '.vtp': vtk.vtkXMLPolyDataReader,
+           '.stl': vtk.vtkSTLReader}
+
+def default_catalog_path(directory):
+    return os.path.join(directory, CATALOG_FILE)
+
+def connect(catalog_path):
+    connection = sqlite3.connect(catalog_path)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+# Read a mesh once and collect everything the batch scripts need to know about it
+def describe_mesh(path):
+    extension = os.path.splitext(path)[1].lower()
+    reader = READERS[extension]()
+    reader.SetFileName(path)
+    reader.Update()
+    polydata = reader.GetOutput()
+    points = vtk_to_numpy(polydata.GetPoints().GetData())
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path),
+            'directory': os.path.abspath(os.path.dirname(path)),
+            'name': os.path.basename(path),
+            'format': extension.lstrip('.'),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_sha256(path),
+            'n_vertices': len(points),
+            'n_faces': polydata.GetNumberOfPolys(),
+            **dict(zip(['xmin', 'ymin', 'zmin'], points.min(axis=0).tolist())),
+            **dict(zip(['xmax', 'ymax', 'zmax'], points.max(axis=0).tolist())),
+            **dict(zip(['cx', 'cy', 'cz'], centroid(points).tolist())),
+            'centroid_size': float(centroid_size(points)),
+            'scanned_at': time.time()}
+
+# Bring the catalog up to date with the directory: only new or changed files (by size and mtime) are read,
+# in n_workers processes (all cores by default), and rows of deleted files are removed
+def scan_directory(directory, catalog_path=None, extensions=MESH_EXTENSIONS, n_workers=None):
+    directory = os.path.abspath(directory)
+    catalog_path = catalog_path or default_catalog_path(directory)
+    with connect(catalog_path) as connection:
+        known = {row['path']: (row['size'], row['mtime_ns']) for row in
+                 connection.execute("SELECT path, size, mtime_ns FROM specimens WHERE directory = ?", (directory,))}
+        present = []
+        changed = []
+        for filename in sorted(os.listdir(directory)):
+            if filename.lower().endswith(extensions):
+                path = os.path.join(directory, filename)
+                stat = os.stat(path)
+                present.append(path)
+                if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                    changed.append(path)
+
+        if n_workers == 1 or len(changed) < 2:
+            records = [describe_mesh(path) for path in changed]
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                records = list(executor.map(describe_mesh, changed))
+
+        connection.executemany("INSERT OR REPLACE INTO specimens ({}) VALUES ({})".format(
+            ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))),
+            [[record[column] for column in COLUMNS] for record in records])
+        removed = set(known) - set(present)
+        connection.executemany("DELETE FROM specimens WHERE path = ?", [(path,) for path in removed])
+    connection.close()
+    print(f"Catalog {catalog_path}: {len(changed)} scanned, {len(present) - len(changed)} unchanged, "
+          f"{len(removed)} removed")
+    return catalog_path
+
+# Catalog rows of a directory (optionally a single format), sorted by file name
+def list_specimens(directory, catalog_path=None, file_format=None, refresh=True):
+    directory = os.path.abspath(directory)
+    catalog_path = catalog_path or default_catalog_path(directory)
+    if refresh:
+        scan_directory(directory, catalog_path)
+    query = "SELECT * FROM specimens WHERE directory = ?"
+    parameters = [directory]
+    if file_format is not None:
+        query += " AND format = ?"
+        parameters.append(file_format.lstrip('.'))
+    connection = connect(catalog_path)
+    rows = [dict(row) for row in connection.execute(query + " ORDER BY name", parameters)]
+    connection.close()
+    return rows
+
+def specimen_filenames(directory, file_format='vtk', catalog_path=None, refresh=True):
+    return [row['name'] for row in list_specimens(directory, catalog_path, file_format, refresh)]
+
+# Centroid size report in the Batch_Mesh_Centroid_Measurement_v1 .csv layout
+def centroid_report(directory, output_csv, file_format='vtk', catalog_path=None, refresh=True):
+    rows = list_specimens(directory, catalog_path, file_format, refresh)
+    save_to_csv([(row['name'], row['centroid_size']) for row in rows], output_csv)
+    return rows
+
+# Vertex coordinates bounds of a specimen as a (2, 3) array, as in trimesh's mesh.bounds
+def specimen_bounds(row):
+    return np.array([[row['xmin'], row['ymin'], row['zmin']], [row['xmax'], row['ymax'], row['zmax']]])
+
+if __name__ == '__main__':
+    # Example usage
+    directory = 'F:/aligned-binary-meshes/Yichen Meshes/VTK Files'
+
+    scan_directory(directory)
+    centroid_report(directory, os.path.join(directory, 'Mesh_centroid_sizes.csv'), refresh=False)
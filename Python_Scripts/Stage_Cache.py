@@ -0,0 +1,164 @@
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
+
+# Code for caching the intermediate meshes of the preprocessing stages (decimation, ASCII/VTK conversion, voxelisation)
+# by content: an output is reused whenever the same input file is run through the same stage with the same parameters
+
+# Author: James M. Mulqueeney
+
+# Date Last Modified: 18/10/2026
+
+# Load in libraries
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+
+INDEX_FILE = 'cache_index.sqlite'
+CACHE_BUDGET_MB = 20480
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE TABLE IF NOT EXISTS input_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stage_counts (
+    stage TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Several worker processes share the index, so wait for the lock rather than failing
+def connect(cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(cache_dir, INDEX_FILE), timeout=120)
+    connection.executescript(SCHEMA)
+    return connection
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+# Content hash of an input, only recomputed when its size or modification time changed
+def input_hash(connection, path):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    row = connection.execute("SELECT size, mtime_ns, sha256 FROM input_hashes WHERE path = ?", (path,)).fetchone()
+    if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+        return row[2]
+    sha256 = file_sha256(path)
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO input_hashes VALUES (?, ?, ?, ?)",
+                           (path, stat.st_size, stat.st_mtime_ns, sha256))
+    return sha256
+
+# Cache key of a stage output: the stage name, its parameters and the content hash of its input
+def cache_key(stage, input_sha256, params):
+    description = json.dumps({'stage': stage, 'params': params, 'input': input_sha256}, sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+def _object_path(cache_dir, key, extension):
+    return os.path.join(cache_dir, 'objects', key[:2], key + extension)
+
+# Copy rather than hard link: the stages rewrite their outputs in place (open(..., 'w'), tifffile.imwrite,
+# sitk.WriteImage), which would change a cached object sharing the output's inode. The destination is a new file
+# that only appears once complete, so every cache object is a file of its own and its size is counted once
+def _place(source, destination):
+    temporary_path = destination + '.tmp'
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    shutil.copyfile(source, temporary_path)
+    os.replace(temporary_path, destination)
+
+def _count(connection, stage, column):
+    with connection:
+        connection.execute("INSERT OR IGNORE INTO stage_counts (stage) VALUES (?)", (stage,))
+        connection.execute("UPDATE stage_counts SET {0} = {0} + 1 WHERE stage = ?".format(column), (stage,))
+
+# Copy the cached output for key to output_path, returning False when it is not in the cache
+def lookup(connection, cache_dir, stage, key, output_path):
+    row = connection.execute("SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+    if row is None or not os.path.exists(os.path.join(cache_dir, row[0])):
+        _count(connection, stage, 'misses')
+        return False
+    _place(os.path.join(cache_dir, row[0]), output_path)
+    with connection:
+        connection.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+    _count(connection, stage, 'hits')
+    return True
+
+# Remove the least recently used outputs until the cache fits in budget_mb
+def evict(connection, cache_dir, budget_mb=CACHE_BUDGET_MB):
+    budget = budget_mb * 1024 ** 2
+    with connection:
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        for key, path, size in connection.execute("SELECT key, path, size FROM entries ORDER BY last_used").fetchall():
+            if total <= budget:
+                break
+            if os.path.exists(os.path.join(cache_dir, path)):
+                os.remove(os.path.join(cache_dir, path))
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+# Add a freshly computed output to the cache, then evict down to the budget
+def store(connection, cache_dir, stage, key, output_path, budget_mb=CACHE_BUDGET_MB):
+    object_path = _object_path(cache_dir, key, os.path.splitext(output_path)[1])
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    _place(output_path, object_path)
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                           (key, stage, os.path.relpath(object_path, cache_dir), os.path.getsize(object_path),
+                            time.time()))
+    evict(connection, cache_dir, budget_mb)
+
+# Run func(input_path, output_path) through the cache: on a hit the cached output is placed at output_path
+# and func is not called. Returns (hit, result of func or None)
+def cached_call(cache_dir, stage, func, input_path, output_path, params, budget_mb=CACHE_BUDGET_MB):
+    connection = connect(cache_dir)
+    try:
+        key = cache_key(stage, input_hash(connection, input_path), params)
+        if lookup(connection, cache_dir, stage, key, output_path):
+            return True, None
+        result = func(input_path, output_path)
+        store(connection, cache_dir, stage, key, output_path, budget_mb)
+        return False, result
+    finally:
+        connection.close()
+
+# Hits and misses of this run for one stage, from the hit flags returned by cached_call
+def summarise_hits(stage, hits):
+    hits = list(hits)
+    print(f"{stage}: {sum(hits)} cache hits, {len(hits) - sum(hits)} misses")
+
+# Cumulative hits, misses, entries and size per stage
+def cache_report(cache_dir):
+    connection = connect(cache_dir)
+    rows = connection.execute("""
+        SELECT c.stage, c.hits, c.misses, COUNT(e.key), COALESCE(SUM(e.size), 0)
+        FROM stage_counts c LEFT JOIN entries e ON e.stage = c.stage
+        GROUP BY c.stage ORDER BY c.stage""").fetchall()
+    connection.close()
+    for stage, hits, misses, entries, size in rows:
+        print(f"{stage}: {hits} hits, {misses} misses, {entries} entries, {size / 1024 ** 2:.1f} MB")
+    return rows
+
+if __name__ == '__main__':
+    # Example usage
+    cache_dir = 'E:/CTData/James Mulqueeney/Mammalian Data/Stage Cache'
+
+    cache_report(cache_dir)
@@ -1,62 +1,272 @@
-# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania 
+# Paper - Comparing landmark-free and manual landmarking methods for macroevolutionary studies using the mammalian crania
 
-# Code for voxelisation of mesh to allow for segementation 
+# Code for voxelisation of mesh to allow for segementation
 
 # Author: James M. Mulqueeney
 
-# Date Last Modified: 13/03/2024
+# Date Last Modified: 18/10/2026
 
-# Load in libraries 
+# Load in libraries
 import os
+import warnings
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import trimesh
 import numpy as np
 import pyvista as pv
 import SimpleITK as sitk
+import tifffile
+import scipy.sparse
+from scipy import ndimage
+from scipy.sparse.csgraph import connected_components
+from trimesh import remesh
+from Pipeline_Instrumentation import span, report, reset_peak_rss, peak_rss_mb
+from Stage_Cache import cached_call, summarise_hits, CACHE_BUDGET_MB
+
+# Memory allowed per mesh by the slab mode, and the working memory it needs per voxel of a slab
+# (surface mask, background mask, int32 labels and the masks made while filling)
+MEMORY_BUDGET_MB = 2048
+BYTES_PER_VOXEL = 12
+# Memory of remesh.subdivide_to_size (points, faces, edges and the voxel indices of the points) per sub-triangle,
+# measured at 250-350 bytes; a face whose longest edge is split into n segments makes about n^2 sub-triangles
+BYTES_PER_SUBTRIANGLE = 400
+# Share of the budget for the slab masks; the rest bounds the subdivision of the faces
+SLAB_SHARE = 0.5
+# The slab mode warns when its peak memory goes this far over the budget
+BUDGET_TOLERANCE = 1.25
+
+# Voxel pitch is the largest bounding box dimension divided by this.
+# The dense mode subdivides the whole mesh at once (as mesh.voxelized() does), so at the default divisor a
+# large mesh can need several GB; the slab mode keeps to its memory budget
+PITCH_DIVISOR = 500.0
 
 # Define a function to calculate adaptive pitch based on mesh properties
-def calculate_adaptive_pitch(mesh):
+def calculate_adaptive_pitch(mesh, pitch_divisor=PITCH_DIVISOR):
     # Example: Calculate pitch based on the bounding box dimensions
     bounding_box = mesh.bounds
     max_dimension = max(bounding_box[1] - bounding_box[0])
-    adaptive_pitch = max_dimension / 500.0  # Adjust the divisor as needed
+    adaptive_pitch = max_dimension / pitch_divisor  # Adjust the divisor as needed
     return adaptive_pitch
 
-# Step 1: Specify the directories for input meshes and output files
-input_directory = 'path/to/your/meshes/directory'
-output_directory = 'path/to/your/output/directory'
-
-# Step 2: Get a list of .ply mesh files in the input directory
-mesh_files = [file for file in os.listdir(input_directory) if file.endswith('.ply')]
-
-# Step 3: Process each mesh file
-for mesh_file in mesh_files:
-    # Step 3a: Load the .ply mesh data
-    mesh_path = os.path.join(input_directory, mesh_file)
-    mesh = trimesh.load_mesh(mesh_path)   
-    # Step 3b: Calculate the adaptive pitch for this mesh
-    adaptive_pitch = calculate_adaptive_pitch(mesh)    
-    # Step 3c: Transform the mesh to the correct position and orientation
-    # Step 3d: Convert the mesh to a closed structure using adaptive pitch
-    volume = mesh.voxelized(pitch=adaptive_pitch)    
-    # Step 3e: Convert the voxel grid to a binary voxel map
+# Dense mode: voxelise the whole mesh at once, fill the inner region and save as a multipage .tiff stack
+def voxelise_mesh(mesh_path, output_path, pitch_divisor=PITCH_DIVISOR):
+    # Load the .ply mesh data
+    with span('voxel.load', inputs=[mesh_path]):
+        mesh = trimesh.load_mesh(mesh_path)
+    # Calculate the adaptive pitch for this mesh
+    adaptive_pitch = calculate_adaptive_pitch(mesh, pitch_divisor)
+    # Convert the mesh to a closed structure using adaptive pitch
+    with span('voxel.voxelized'):
+        volume = mesh.voxelized(pitch=adaptive_pitch)
+    # Convert the voxel grid to a binary voxel map
     voxel_map = volume.matrix.astype(np.uint8)
-    voxel_map = np.flip(voxel_map, axis=0)   
+    voxel_map = np.flip(voxel_map, axis=0)
     # Calculate the spacing based on the voxel grid dimensions and bounds
     dimensions = np.array(voxel_map.shape)
     min_bounds, max_bounds = volume.bounds
-    spacing = (max_bounds - min_bounds) / (dimensions - 1)    
+    spacing = (max_bounds - min_bounds) / (dimensions - 1)
     # Create the SimpleITK image with correct spacing
     binary_image = sitk.GetImageFromArray(voxel_map)
     binary_image.SetSpacing(spacing.tolist())
-    binary_image.SetOrigin(min_bounds)  # Set the origin to match the mesh    
-    # Step 3f: Apply binary morphological operations to fill the inner region
-    filled_image = sitk.BinaryFillhole(binary_image)    
-    # Step 3g: Export the binary voxel map with the filled inner region as a multipage .tiff stack
-    filled_voxel_map_array = sitk.GetArrayFromImage(filled_image)
-    filled_image = sitk.GetImageFromArray(filled_voxel_map_array)    
-    # Set the spacing and origin for the final output
-    filled_image.SetSpacing(spacing.tolist())
-    filled_image.SetOrigin(min_bounds)    
-    # Save the output with the same filename but different extension
-    output_path = os.path.join(output_directory, os.path.splitext(mesh_file)[0] + '.tif')
-    sitk.WriteImage(filled_image, output_path, useCompression=True)
+    binary_image.SetOrigin(min_bounds)  # Set the origin to match the mesh
+    # Apply binary morphological operations to fill the inner region (keeps the spacing and origin)
+    with span('voxel.fillhole'):
+        filled_image = sitk.BinaryFillhole(binary_image)
+    # Export the binary voxel map with the filled inner region as a multipage .tiff stack
+    with span('voxel.write', outputs=[output_path]):
+        sitk.WriteImage(filled_image, output_path, useCompression=True)
+
+# Voxel index of the grid origin and the grid shape, matching mesh.voxelized(): subdivided points
+# stay within their faces, so the extreme voxels are those of the mesh vertices
+def grid_indices(mesh, pitch):
+    min_index = np.round(mesh.vertices.min(axis=0) / pitch).astype(np.int64)
+    max_index = np.round(mesh.vertices.max(axis=0) / pitch).astype(np.int64)
+    return min_index, max_index - min_index + 1
+
+# Sub-triangles each face is split into by remesh.subdivide_to_size(max_edge): its longest edge is halved
+# until it is no longer than max_edge, giving n segments and about n^2 sub-triangles
+def subdivided_face_counts(mesh, max_edge):
+    triangles = mesh.vertices[mesh.faces]
+    longest = np.linalg.norm(triangles - np.roll(triangles, 1, axis=1), axis=2).max(axis=1)
+    segments = 2.0 ** np.ceil(np.log2(np.maximum(longest / max_edge, 1.0)))
+    return segments ** 2
+
+def _mark_hits(slab, hits, start, stop):
+    hits = hits[(hits[:, 0] >= start) & (hits[:, 0] < stop)]
+    slab[hits[:, 0] - start, hits[:, 1], hits[:, 2]] = True
+
+# Surface voxels of the slab [start, stop) along the first grid axis, found by subdividing only the faces
+# that reach into the slab (the same points mesh.voxelized() would produce for those voxels). The points of a
+# face depend only on that face, so the faces are subdivided in chunks of at most max_subtriangles.
+def rasterise_slab(mesh, pitch, origin_index, shape, start, stop, face_range, vertex_hits, face_counts,
+                   max_subtriangles):
+    slab = np.zeros((stop - start, shape[1], shape[2]), dtype=bool)
+    _mark_hits(slab, vertex_hits, start, stop)
+    selected = np.flatnonzero((face_range[1] >= start) & (face_range[0] < stop))
+    # Chunk boundaries where the running sub-triangle count passes each multiple of max_subtriangles
+    running = np.cumsum(face_counts[selected])
+    bounds = np.searchsorted(running, np.arange(max_subtriangles, running[-1] if len(running) else 0,
+                                                max_subtriangles), side='right')
+    for chunk in np.split(selected, np.unique(bounds)):
+        if not len(chunk):
+            continue
+        used, local_faces = np.unique(mesh.faces[chunk], return_inverse=True)
+        vertices, _ = remesh.subdivide_to_size(mesh.vertices[used], local_faces.reshape(-1, 3),
+                                               max_edge=pitch / 2.0, max_iter=10)
+        _mark_hits(slab, np.round(vertices / pitch).astype(np.int64) - origin_index, start, stop)
+        del vertices
+    return slab
+
+# Slab mode: rasterise and fill the mesh one slab of pages at a time and stream the pages to a compressed .tiff,
+# keeping the working memory under memory_budget_mb (SLAB_SHARE of it for the slab masks, the rest for
+# subdividing the faces of a slab chunk by chunk).
+# Pass 1 rasterises each slab (kept bit-packed in a scratch file), labels its background and links the labels
+# across slab boundaries. Background connected to the border of the grid stays empty and every other background
+# region is filled, as sitk.BinaryFillhole does for the whole volume. Pass 2 writes the filled pages.
+def voxelise_mesh_slabs(mesh_path, output_path, memory_budget_mb=MEMORY_BUDGET_MB, pitch_divisor=PITCH_DIVISOR):
+    with span('voxel.load', inputs=[mesh_path]):
+        mesh = trimesh.load_mesh(mesh_path)
+    return voxelise_trimesh_slabs(mesh, output_path, memory_budget_mb, pitch_divisor)
+
+# Slab mode for a mesh already in memory
+def voxelise_trimesh_slabs(mesh, output_path, memory_budget_mb=MEMORY_BUDGET_MB, pitch_divisor=PITCH_DIVISOR):
+    pitch = calculate_adaptive_pitch(mesh, pitch_divisor)
+    origin_index, shape = grid_indices(mesh, pitch)
+    nx, ny, nz = (int(n) for n in shape)
+    budget = memory_budget_mb * 1024 ** 2
+    slab_size = max(1, int(SLAB_SHARE * budget // (BYTES_PER_VOXEL * ny * nz)))
+    slabs = [(start, min(start + slab_size, nx)) for start in range(0, nx, slab_size)]
+    face_counts = subdivided_face_counts(mesh, pitch / 2.0)
+    max_subtriangles = max(1, int((1 - SLAB_SHARE) * budget // BYTES_PER_SUBTRIANGLE))
+    reset_peak_rss()
+    start_mb = peak_rss_mb()
+
+    face_index = np.round(mesh.vertices[:, 0] / pitch).astype(np.int64)[mesh.faces] - origin_index[0]
+    face_range = (face_index.min(axis=1), face_index.max(axis=1))
+    vertex_hits = np.round(mesh.vertices / pitch).astype(np.int64) - origin_index
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as scratch:
+        surface = np.lib.format.open_memmap(os.path.join(scratch, 'surface.npy'), mode='w+', dtype=np.uint8,
+                                            shape=(nx, ny, (nz + 7) // 8))
+        offsets, outside, links = [], [], []
+        n_labels = 1
+        previous_plane = None
+        with span('voxel.rasterise'):
+            for start, stop in slabs:
+                slab = rasterise_slab(mesh, pitch, origin_index, shape, start, stop, face_range, vertex_hits,
+                                      face_counts, max_subtriangles)
+                surface[start:stop] = np.packbits(slab, axis=2)
+                labels, count = ndimage.label(~slab)
+                labels[labels > 0] += n_labels - 1
+                offsets.append(n_labels - 1)
+                n_labels += count
+                # Background touching the border of the grid is outside the mesh
+                border = [labels[:, 0, :], labels[:, -1, :], labels[:, :, 0], labels[:, :, -1]]
+                if start == 0:
+                    border.append(labels[0])
+                if stop == nx:
+                    border.append(labels[-1])
+                outside.append(np.unique(np.concatenate([plane.ravel() for plane in border])))
+                # Background regions touching across the slab boundary are the same region
+                if previous_plane is not None:
+                    pairs = np.column_stack((previous_plane.ravel(), labels[0].ravel()))
+                    links.append(np.unique(pairs[(pairs[:, 0] > 0) & (pairs[:, 1] > 0)], axis=0))
+                previous_plane = labels[-1].copy()
+                del slab, labels
+
+        links = np.concatenate(links) if links else np.empty((0, 2), dtype=np.int64)
+        graph = scipy.sparse.coo_matrix((np.ones(len(links)), (links[:, 0], links[:, 1])), shape=(n_labels, n_labels))
+        _, component = connected_components(graph, directed=False)
+        outside_component = np.zeros(component.max() + 1, dtype=bool)
+        outside_component[component[np.concatenate(outside)]] = True
+        is_outside = outside_component[component]
+
+        # Pass 2: fill each slab and write its pages, last slab first to match the flip of the dense mode
+        def filled_pages():
+            for (start, stop), offset in reversed(list(zip(slabs, offsets))):
+                slab = np.unpackbits(surface[start:stop], axis=2, count=nz).astype(bool)
+                labels, _ = ndimage.label(~slab)
+                labels[labels > 0] += offset
+                filled = (slab | ~is_outside[labels]).astype(np.uint8)
+                del slab, labels
+                for page in filled[::-1]:
+                    yield page
+
+        # Same spacing and origin as the dense mode; sitk.WriteImage stores the spacing (mm) as pixels per inch
+        spacing = shape * pitch / (shape - 1)
+        min_bounds = (origin_index - 0.5) * pitch
+        with span('voxel.fill_write', outputs=[output_path]):
+            tifffile.imwrite(output_path, filled_pages(), shape=(nx, ny, nz), dtype=np.uint8, compression='zlib',
+                             resolution=(25.4 / spacing[0], 25.4 / spacing[1]), resolutionunit='INCH',
+                             metadata={'spacing': spacing.tolist(), 'origin': min_bounds.tolist()})
+        del surface
+    # Check the budget held: growth of the peak resident memory over what the process held before rasterising
+    used_mb = peak_rss_mb() - start_mb
+    if used_mb > BUDGET_TOLERANCE * memory_budget_mb:
+        warnings.warn("Slab voxelisation of {} used {:.0f} MB, over its {:.0f} MB budget".format(
+            os.path.basename(output_path), used_mb, memory_budget_mb))
+    return used_mb
+
+def _voxelise(mesh_path, output_path, mode, memory_budget_mb, pitch_divisor):
+    with span('voxelise', os.path.basename(mesh_path)):
+        if mode == 'dense':
+            voxelise_mesh(mesh_path, output_path, pitch_divisor)
+        else:
+            voxelise_mesh_slabs(mesh_path, output_path, memory_budget_mb, pitch_divisor)
+
+# The memory budget does not change the stack, so only the mode and pitch divisor are part of the cache key
+def _voxelise_task(task):
+    mesh_path, output_path, mode, memory_budget_mb, pitch_divisor, cache_dir, cache_budget_mb = task
+    if cache_dir is None:
+        _voxelise(mesh_path, output_path, mode, memory_budget_mb, pitch_divisor)
+        return os.path.basename(output_path), False
+    hit, _ = cached_call(cache_dir, 'voxelise',
+                         lambda source, target: _voxelise(source, target, mode, memory_budget_mb, pitch_divisor),
+                         mesh_path, output_path, {'mode': mode, 'pitch_divisor': pitch_divisor}, cache_budget_mb)
+    return os.path.basename(output_path), hit
+
+# Voxelise every .ply mesh in the input directory with n_workers processes (all cores by default).
+# In slab mode the memory budget is shared between the workers. With a cache_dir, stacks made before from the
+# same mesh and settings are copied from the cache instead.
+def batch_voxelise(input_directory, output_directory, mode='slab', n_workers=None, memory_budget_mb=MEMORY_BUDGET_MB,
+                   pitch_divisor=PITCH_DIVISOR, cache_dir=None, cache_budget_mb=CACHE_BUDGET_MB):
+    os.makedirs(output_directory, exist_ok=True)
+    mesh_files = sorted(file for file in os.listdir(input_directory) if file.endswith('.ply'))
+    n_workers = max(1, min(n_workers or os.cpu_count() or 1, len(mesh_files)))
+    tasks = [(os.path.join(input_directory, mesh_file),
+              os.path.join(output_directory, os.path.splitext(mesh_file)[0] + '.tif'),
+              mode, memory_budget_mb / n_workers, pitch_divisor, cache_dir, cache_budget_mb)
+             for mesh_file in mesh_files]
+    if n_workers == 1:
+        written = [_voxelise_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            written = list(executor.map(_voxelise_task, tasks))
+    for output_file, hit in written:
+        print(f"{'Copied cached' if hit else 'Saved'} {output_file}")
+    if cache_dir is not None:
+        summarise_hits('voxelise', [hit for _, hit in written])
+    report()
+
+# Voxelise one mesh in both modes and check the stacks match, voxel for voxel and in the spacing SimpleITK reads
+def compare_modes(mesh_path, output_directory, memory_budget_mb=MEMORY_BUDGET_MB, pitch_divisor=PITCH_DIVISOR):
+    os.makedirs(output_directory, exist_ok=True)
+    name = os.path.splitext(os.path.basename(mesh_path))[0]
+    images = {}
+    for mode in ('dense', 'slab'):
+        output_path = os.path.join(output_directory, '{}_{}.tif'.format(name, mode))
+        _voxelise(mesh_path, output_path, mode, memory_budget_mb, pitch_divisor)
+        images[mode] = sitk.ReadImage(output_path)
+    assert np.allclose(images['dense'].GetSpacing(), images['slab'].GetSpacing(), rtol=1e-6), \
+        (images['dense'].GetSpacing(), images['slab'].GetSpacing())
+    identical = np.array_equal(sitk.GetArrayFromImage(images['dense']), sitk.GetArrayFromImage(images['slab']))
+    print("spacing: {}, identical voxels: {}".format(images['dense'].GetSpacing(), identical))
+    return identical
+
+if __name__ == '__main__':
+    # Step 1: Specify the directories for input meshes and output files
+    input_directory = 'path/to/your/meshes/directory'
+    output_directory = 'path/to/your/output/directory'
+
+    # Step 2: Voxelise each .ply mesh file into a filled .tif stack
+    batch_voxelise(input_directory, output_directory)
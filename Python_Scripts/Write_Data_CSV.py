@@ -1,26 +1,34 @@
 import xml.etree.ElementTree as ET
 import csv
 
-# Load the XML file
-file_path = 'F:/aligned-binary-meshes/Yichen Meshes/VTK Files/data_set.xml'
-tree = ET.parse(file_path)
-root = tree.getroot()
+# Extract and list <filename> elements of a data_set.xml file in the order they appear
+def read_data_set_filenames(file_path):
+    # Load the XML file
+    tree = ET.parse(file_path)
+    root = tree.getroot()
+    filenames = []
+    for filename in root.findall('.//filename'):
+        filenames.append(filename.text)
+    return filenames
 
-# Extract and list <filename> elements in the order they appear
-filenames = []
-for filename in root.findall('.//filename'):
-    filenames.append(filename.text)
+# Write the filenames to the CSV file
+def write_data_csv(filenames, output_file):
+    with open(output_file, 'w', newline='') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        # Write header
+        csvwriter.writerow(['Filename'])
+        # Write each filename
+        for name in filenames:
+            csvwriter.writerow([name])
 
-# Specify the path for the output CSV file
-output_file = 'F:/aligned-binary-meshes/Yichen Meshes/VTK Files/data.csv'
+if __name__ == '__main__':
+    # Read the filenames from the data_set.xml Deformetrica runs on, so data.csv has the same subjects in the same order
+    file_path = 'F:/aligned-binary-meshes/Yichen Meshes/VTK Files/data_set.xml'
+    filenames = read_data_set_filenames(file_path)
 
-# Write the filenames to the CSV file
-with open(output_file, 'w', newline='') as csvfile:
-    csvwriter = csv.writer(csvfile)
-    # Write header
-    csvwriter.writerow(['Filename'])
-    # Write each filename
-    for name in filenames:
-        csvwriter.writerow([name])
+    # Specify the path for the output CSV file
+    output_file = 'F:/aligned-binary-meshes/Yichen Meshes/VTK Files/data.csv'
+
+    write_data_csv(filenames, output_file)
 
-print(f'Filenames have been written to {output_file}')
+    print(f'Filenames have been written to {output_file}')